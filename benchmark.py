@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# offline benchmarks, run against pages saved to disk; no network needed
+# usage (tests/pages has a few pages to try these on):
+#   python benchmark.py listings search_page.html [search_page2.html ...]
+#   python benchmark.py details details_page.html [details_page2.html ...]
+#   python benchmark.py replay corpus_directory [repeat]
+#
+# a corpus directory holds recorded pages: either an archive written by glassdoor.RecordingTransport, or any *.html
+# files (e.g. the ones SingleSearch.dump_text_url writes out), or both
+# requests that the archive's index.jsonl doesn't have an exact response for are answered with a page of the right
+# kind (search, details or salary page, judging by their content), handed out round-robin
+from collections import defaultdict
+from functools import wraps
+import itertools
+import os
+import resource
+import sys
+import time
+import timeit
+import tracemalloc
+
+from lxml import html
+
+import glassdoor
+
+
+def dummy_search():
+    return glassdoor.SingleSearch("", "", None, None, -1, glassdoor.ES_ANY, False, NoThrottle(),
+                                  glassdoor.ProgressTracker(autoprint=False))
+
+
+def load(paths):
+    trees = []
+    for path in paths:
+        with open(path) as f:
+            tree = html.fromstring(f.read())
+        tree.make_links_absolute("https://www.glassdoor.com")
+        trees.append(tree)
+    return trees
+
+
+def bench_listings(paths, repeat=5):
+    # time per search result, for parsing the fields out of a search page (not counting the page's own parse)
+    search = dummy_search()
+    jobs = [job for tree in load(paths) for job in glassdoor.extractors.jobs(tree)]
+    if not jobs:
+        raise SystemExit("No listings found in %s" % ", ".join(paths))
+
+    def parse_all():
+        for job in jobs:
+            search.parse_listing(job)
+    best = min(timeit.repeat(parse_all, number=1, repeat=repeat))
+    print("%d listings: %.1f µs per listing (best of %d)" % (len(jobs), best / len(jobs) * 1e6, repeat))
+
+
+def bench_details(paths, repeat=5):
+    # time per details page, for extracting the description
+    trees = load(paths)
+
+    def parse_all():
+        for tree in trees:
+            glassdoor.SingleSearch.parse_description(tree)
+    best = min(timeit.repeat(parse_all, number=1, repeat=repeat))
+    print("%d details pages: %.1f µs per page (best of %d)" % (len(trees), best / len(trees) * 1e6, repeat))
+
+
+class NoThrottle(glassdoor.Throttler):
+    def throttle(self, func):
+        return func()
+
+
+class CorpusTransport(glassdoor.ReplayTransport):
+    # a ReplayTransport that makes do with whatever pages the corpus has, for requests it has no exact recording of
+    def __init__(self, corpus):
+        super().__init__(corpus)
+        self.by_kind = defaultdict(list)
+        for name in sorted(os.listdir(corpus)):
+            if name != "index.jsonl":
+                text = self.read(name)
+                self.by_kind[self.classify(text)].append(text)
+        self.round_robin = {kind: itertools.cycle(texts) for kind, texts in self.by_kind.items()}
+
+    @staticmethod
+    def classify(text):
+        if "SalaryRowStyle__row" in text:
+            return "salary"
+        if "jobDescriptionContent" in text:
+            return "details"
+        if 'class="jl"' in text:
+            return "search"
+        return "other"
+
+    @staticmethod
+    def kind_of(url):
+        if "details.htm" in url:
+            return "details"
+        if "Salaries-" in url or "Salary" in url:
+            return "salary"
+        return "search"
+
+    def missing(self, method, url, **kwargs):
+        kind = self.kind_of(url)
+        if kind not in self.round_robin:
+            raise KeyError("No recorded %s page to answer %s %s with" % (kind, method, url))
+        return glassdoor.CachedResponse(url, next(self.round_robin[kind]))
+
+
+class Timings:
+    # wraps functions (in place, on their class) to accumulate their call count and total time
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.patched = []
+
+    def wrap(self, owner, name):
+        original = owner.__dict__[name]
+        if isinstance(original, property):
+            func = original.fget
+        elif isinstance(original, (staticmethod, classmethod)):
+            func = original.__func__
+        else:
+            func = original
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.calls[name] += 1
+                self.seconds[name] += time.perf_counter() - start
+        setattr(owner, name, timed if func is original else type(original)(timed))
+        self.patched.append((owner, name, original))
+
+    def unwrap(self):
+        for owner, name, original in reversed(self.patched):
+            setattr(owner, name, original)
+
+    def report(self):
+        for name in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            print("  %-28s %7d calls %10.1f ms %9.1f µs/call" % (
+                name, self.calls[name], self.seconds[name] * 1e3, self.seconds[name] / self.calls[name] * 1e6))
+
+
+def replay_pass(transport):
+    # runs every recorded search page of the corpus through the scraper; returns the amount of listings scraped
+    search = dummy_search()
+    search.transport = transport
+    search.location_compound_id = ("C", 1)
+    listings = 0
+    for text in transport.by_kind["search"]:
+        page = glassdoor.ParsedResponse(glassdoor.CachedResponse("https://www.glassdoor.com/Job/jobs.htm", text))
+        search.check_page_for_errors(page)
+        page.tree.make_links_absolute("https://www.glassdoor.com")
+        if '"filterOptions":"' in text:
+            search.parse_filter_options(page.tree, "INDUSTRY")
+        listings += sum(1 for _ in search.listings_from_page(page))
+    return listings
+
+
+def bench_replay(corpus, repeat=3):
+    transport = CorpusTransport(corpus)
+    if not transport.by_kind["search"]:
+        raise SystemExit("No recorded search pages in %s" % corpus)
+    print("Corpus: %s" % ", ".join("%d %s pages" % (len(texts), kind)
+                                   for kind, texts in sorted(transport.by_kind.items())))
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        listings = replay_pass(transport)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%d listings in %.3f s: %.1f listings/s (best of %d)" % (listings, best, listings / best, repeat))
+
+    timings = Timings()
+    for name in ["listings_from_page", "parse_listing", "scrape_details", "get_details_page", "parse_description",
+                 "get_salary_the_hard_way", "parse_salary_amount", "parse_filter_options"]:
+        timings.wrap(glassdoor.SingleSearch, name)
+    for name in ["requests_op", "check_page_for_errors"]:
+        timings.wrap(glassdoor.BaseSearch, name)
+    timings.wrap(glassdoor.ParsedResponse, "tree")
+    try:
+        replay_pass(transport)
+    finally:
+        timings.unwrap()
+    print("Per function (cumulative, one pass; listings_from_page is a generator, so only its own frames count):")
+    timings.report()
+
+    tracemalloc.start()
+    try:
+        replay_pass(transport)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # tracemalloc only sees allocations made through python's allocator, not lxml's trees, which live in libxml2's
+    # own malloc'd memory; the peak resident set size covers those (ru_maxrss is in KiB, except on macOS in bytes)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss /= 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+    print("Peak traced memory (python objects only): %.1f MiB" % (peak / 2 ** 20))
+    print("Peak resident memory (whole process, lxml included): %.1f MiB" % max_rss)
+
+
+if __name__ == "__main__":
+    commands = {"listings": bench_listings, "details": bench_details}
+    if len(sys.argv) >= 3 and sys.argv[1] == "replay":
+        bench_replay(sys.argv[2], *map(int, sys.argv[3:4]))
+    elif len(sys.argv) >= 3 and sys.argv[1] in commands:
+        commands[sys.argv[1]](sys.argv[2:])
+    else:
+        raise SystemExit("usage: python benchmark.py listings|details page.html [page.html ...]\n"
+                         "       python benchmark.py replay corpus_directory [repeat]")
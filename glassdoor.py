@@ -1,15 +1,21 @@
 # -*- coding: utf-8 -*-
-import ast
-from collections import defaultdict
+# the heavier dependencies (requests, lxml, regex and forex_python), and even some of the standard library's (such as
+# http.server, multiprocessing and concurrent.futures), are imported where they're first needed rather than up here,
+# so that importing this module, or a python -m glassdoor --dry-run, stays fast
+from collections import Counter, defaultdict, deque
 import datetime
-from forex_python import converter
-from functools import lru_cache
-from lxml import etree, html
+import hashlib
+import json
+import os
 import random
-import regex
-import requests
+import sqlite3
+import sys
 from tempfile import NamedTemporaryFile
+import threading
+import time
 from time import sleep
+from urllib.parse import urlsplit
+import zlib
 
 # employer size
 ES_ANY = 0
@@ -19,8 +25,272 @@ ES_501_1000 = 3
 ES_1001_5000 = 4
 ES_5001_PLUS = 5
 
-__all__ = ["Search", "Throttler", "ProgressTracker", "ScrapeError", "TerminalScrapeError", "ES_ANY", "ES_0_200",
-           "ES_201_500", "ES_501_1000", "ES_1001_5000", "ES_5001_PLUS"]
+__all__ = ["Search", "Listing", "ListingSet", "Analysis", "Throttler", "RateController", "ProgressTracker", "Metrics",
+           "ResponseCache", "ListingIndex", "ListingRegistry", "DescriptionStore", "Checkpoint", "HTTPTransport",
+           "RecordingTransport", "ReplayTransport", "JSONLSink", "SQLiteSink", "ParquetSink", "ArrowSink",
+           "PartitionCounts", "LocationIndex", "SalaryIndex", "ExchangeRates", "WorkQueue", "Coordinator",
+           "Batch", "ScrapeError", "TerminalScrapeError", "ReplayMissError", "ES_ANY", "ES_0_200", "ES_201_500",
+           "ES_501_1000", "ES_1001_5000", "ES_5001_PLUS"]
+
+
+class Listing:
+    """
+    A compact listing, for big sweeps: a slotted record rather than a dict, with the fields that repeat across
+    thousands of listings (company, city, ...) interned, and the salary range unpacked into salary_low and salary_high.
+    It reads like a listing dict (listing["salary"], "rating" in listing, get(), keys()); to_dict() turns it back into
+    one. As attributes, fields the listing doesn't have are None; the ones it does have, but as None (like state, for a
+    remote job), are remembered in nones, so that reading it like a dict, and to_dict(), tell the two apart like the
+    dict did. Fields it has no slot for are kept in a dict of extras.
+    """
+    # in the order the dicts have them; salary goes right before description (or description_hash)
+    fields = ["title", "company", "location", "requested_location", "city", "state", "url", "listing_id", "rating",
+              "keywords", "requested_locations", "salary_sample_size", "salary_low", "salary_high", "description_hash",
+              "description"]
+    interned = ["title", "company", "location", "requested_location", "city", "state", "description_hash"]
+    numeric = ["rating", "salary_low", "salary_high", "salary_sample_size"]
+    __slots__ = fields + ["extras", "nones"]
+    none_sets = {}  # every distinct nones, so that listings share them
+
+    def __init__(self, **fields):
+        # salary (a (low, high) tuple) can be passed as is, or as salary_low and salary_high
+        nones = tuple(name for name in self.fields + ["salary"] if name in fields and fields[name] is None)
+        salary = fields.pop("salary", None)
+        if salary:
+            fields["salary_low"], fields["salary_high"] = salary
+        for name in self.fields:
+            setattr(self, name, fields.pop(name, None))
+        self.extras = fields or None
+        self.nones = self.none_sets.setdefault(nones, nones) if nones else None
+
+    @classmethod
+    def from_dict(cls, listing):
+        fields = dict(listing)
+        for name in cls.interned:
+            if fields.get(name) is not None:
+                fields[name] = sys.intern(fields[name])
+        return cls(**fields)
+
+    def to_dict(self):
+        listing = {}
+        nones = self.nones or ()
+        for name in self.fields:
+            if name == "description_hash" and (self.salary_low is not None or "salary" in nones):
+                listing["salary"] = self.get("salary")
+            if name not in ("salary_low", "salary_high") and (getattr(self, name) is not None or name in nones):
+                listing[name] = getattr(self, name)
+        if self.extras:
+            listing.update(self.extras)
+        return listing
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        if key == "salary":
+            return (self.salary_low, self.salary_high) if self.salary_low is not None else None
+        if key in self.fields:
+            return getattr(self, key)
+        return self.extras[key]
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return self.get(key)
+
+    def __contains__(self, key):
+        if key == "salary":
+            return self.salary_low is not None or "salary" in (self.nones or ())
+        if key in self.fields:
+            return getattr(self, key) is not None or key in (self.nones or ())
+        return key in (self.extras or {})
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __eq__(self, other):
+        if isinstance(other, (Listing, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, Listing) else other)
+        return NotImplemented
+
+    def __repr__(self):
+        return "Listing(%r)" % self.to_dict()
+
+
+class ListingSet:
+    """
+    A list of Listings (dicts get converted on the way in), which can also hand back any field as a NumPy array, for
+    fast filtering and aggregation (that part needs numpy): numeric fields as floats with NaN where they're missing,
+    other fields as object arrays, or as integer codes into a list of categories (see categorical).
+    """
+    def __init__(self, listings=()):
+        self.listings = []
+        self.extend(listings)
+
+    def append(self, listing):
+        self.listings.append(listing if isinstance(listing, Listing) else Listing.from_dict(listing))
+
+    def extend(self, listings):
+        for listing in listings:
+            self.append(listing)
+
+    def __len__(self):
+        return len(self.listings)
+
+    def __iter__(self):
+        return iter(self.listings)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ListingSet(self.listings[index])
+        return self.listings[index]
+
+    def to_dicts(self):
+        return [listing.to_dict() for listing in self.listings]
+
+    @staticmethod
+    def numpy():
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("ListingSet's columnar views need numpy installed")
+        return numpy
+
+    def column(self, name):
+        numpy = self.numpy()
+        if name == "salary":
+            raise ValueError("salary is split into salary_low and salary_high columns")
+        values = [listing.get(name) for listing in self.listings]
+        if name in Listing.numeric:
+            return numpy.array(values, dtype=float)
+        # filled in one by one, so that list values (keywords, ...) don't get turned into a second dimension
+        column = numpy.empty(len(values), dtype=object)
+        for i, value in enumerate(values):
+            column[i] = value
+        return column
+
+    def columns(self, names=None):
+        return {name: self.column(name) for name in names or Listing.fields}
+
+    def categorical(self, name):
+        # returns (codes, categories): each listing's index into categories, or -1 if it doesn't have the field
+        numpy = self.numpy()
+        categories = {}
+        codes = numpy.fromiter((-1 if value is None else categories.setdefault(value, len(categories))
+                                for value in (listing.get(name) for listing in self.listings)),
+                               dtype=numpy.int32, count=len(self.listings))
+        return codes, list(categories)
+
+    def select(self, mask):
+        # the listings where a boolean array (e.g. ListingSet.column("rating") >= 4) is true
+        return ListingSet(listing for listing, keep in zip(self.listings, mask) if keep)
+
+
+class Analysis:
+    """
+    Vectorized statistics over the listings of a sweep (finished, or still streaming in through extend()); needs numpy.
+    Gives each salary's midpoint and a confidence, aggregates per company or location, and re-filters the listings by
+    other salary and rating thresholds than the search used, all without any new requests.
+    A salary from the search results is posted by the employer, so it gets a confidence of 1; one from the company's
+    salary page is an average of salary_sample_size reports, and gets n / (n + prior_samples).
+    """
+    def __init__(self, listings=(), prior_samples=5):
+        self.listings = listings if isinstance(listings, ListingSet) else ListingSet(listings)
+        self.prior_samples = prior_samples
+        self.np = ListingSet.numpy()
+        self._columns = None
+        self._categorical = {}
+
+    def extend(self, listings):
+        self.listings.extend(listings)
+        self._columns = None
+        self._categorical = {}
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            np = self.np
+            columns = self.listings.columns(["salary_low", "salary_high", "salary_sample_size", "rating"])
+            columns["midpoint"] = (columns["salary_low"] + columns["salary_high"]) / 2
+            samples = columns["salary_sample_size"]
+            confidence = np.where(np.isnan(samples), 1.0, samples / (samples + self.prior_samples))
+            columns["confidence"] = np.where(np.isnan(columns["midpoint"]), 0.0, confidence)
+            self._columns = columns
+        return self._columns
+
+    @property
+    def midpoint(self):
+        return self.columns["midpoint"]
+
+    @property
+    def confidence(self):
+        return self.columns["confidence"]
+
+    def mask(self, minimum_salary=None, minimum_rating=None, minimum_confidence=None, include_no_salary=False):
+        # which listings pass the thresholds; salaries are compared by midpoint
+        np = self.np
+        columns = self.columns
+        keep = np.ones(len(self.listings), dtype=bool)
+        has_salary = ~np.isnan(columns["midpoint"])
+        if minimum_salary is not None:
+            keep &= (columns["midpoint"] >= minimum_salary) | (include_no_salary & ~has_salary)
+        if minimum_confidence is not None:
+            keep &= (columns["confidence"] >= minimum_confidence) | (include_no_salary & ~has_salary)
+        if minimum_rating is not None:
+            keep &= columns["rating"] >= minimum_rating
+        return keep
+
+    def filter(self, **thresholds):
+        # a ListingSet of the listings that pass mask(**thresholds)
+        return self.listings.select(self.mask(**thresholds))
+
+    def aggregate(self, field="company", mask=None):
+        """
+        Per-value statistics of a field (e.g. company, city, requested_location), as columns: category, listings,
+        with_salary, mean_midpoint (weighted by confidence), min_salary, max_salary, and mean_rating.
+        """
+        np = self.np
+        columns = self.columns
+        if field not in self._categorical:
+            self._categorical[field] = self.listings.categorical(field)
+        codes, categories = self._categorical[field]
+        keep = codes >= 0 if mask is None else (codes >= 0) & mask
+        size = len(categories)
+
+        def total(weights, where):
+            return np.bincount(codes[where], weights=weights[where], minlength=size)
+        has_salary = keep & ~np.isnan(columns["midpoint"])
+        has_rating = keep & ~np.isnan(columns["rating"])
+        weights = total(columns["confidence"], has_salary)
+        rated = total(np.ones(len(codes)), has_rating)
+        min_salary = np.full(size, np.nan)
+        max_salary = np.full(size, np.nan)
+        np.fmin.at(min_salary, codes[has_salary], columns["salary_low"][has_salary])
+        np.fmax.at(max_salary, codes[has_salary], columns["salary_high"][has_salary])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "category": categories,
+                "listings": np.bincount(codes[keep], minlength=size),
+                "with_salary": np.bincount(codes[has_salary], minlength=size),
+                "mean_midpoint": total(columns["midpoint"] * columns["confidence"], has_salary) / weights,
+                "min_salary": min_salary,
+                "max_salary": max_salary,
+                "mean_rating": total(columns["rating"], has_rating) / rated,
+            }
+
+    def summary(self, mask=None):
+        # overall salary statistics: how many listings have one, the confidence-weighted mean midpoint, and quartiles
+        np = self.np
+        columns = self.columns
+        has_salary = ~np.isnan(columns["midpoint"])
+        if mask is not None:
+            has_salary &= mask
+        midpoints = columns["midpoint"][has_salary]
+        weights = columns["confidence"][has_salary]
+        return {
+            "listings": int(len(self.listings) if mask is None else mask.sum()),
+            "with_salary": int(has_salary.sum()),
+            "mean_midpoint": float(np.average(midpoints, weights=weights)) if weights.sum() else None,
+            "quartiles": [float(q) for q in np.percentile(midpoints, [25, 50, 75])] if len(midpoints) else None,
+        }
 
 
 class Throttler:
@@ -28,59 +298,265 @@ class Throttler:
     # it uses an exponential distribution (which models the duration between poisson events)
     # and a minimum delay (to loosely model how quickly a human would be able to click a link)
     # all durations are in seconds
+    # it's thread safe: concurrent callers each reserve their own slot, and then wait for it outside the lock
     def __init__(self, average_rate=3, minimum_delay=0.673):
         # a lower average rate sometimes gave me bot warnings
         self.next_allowed_run = datetime.datetime.utcnow()
         self.average_rate = average_rate
         self.minimum_delay = minimum_delay
+        self.lock = threading.Lock()
 
     def _generate_next_delay(self):
         return self.minimum_delay + random.expovariate(1.0 / (self.average_rate - self.minimum_delay))
 
     def throttle(self, func):
-        if self.next_allowed_run > datetime.datetime.utcnow():
-            to_sleep = (self.next_allowed_run - datetime.datetime.utcnow()).total_seconds()
-            sleep(max(to_sleep, 0))
-        self.next_allowed_run = datetime.datetime.utcnow() + datetime.timedelta(seconds=self._generate_next_delay())
+        with self.lock:
+            now = datetime.datetime.utcnow()
+            run_at = max(self.next_allowed_run, now)
+            self.next_allowed_run = run_at + datetime.timedelta(seconds=self._generate_next_delay())
+        to_sleep = (run_at - datetime.datetime.utcnow()).total_seconds()
+        sleep(max(to_sleep, 0))
         return func()
 
+    # a fixed rate doesn't care how the server is doing (RateController does), and every caller backs off on its own
+    def success(self):
+        pass
+
+    def failure(self, error):
+        pass
+
+    def backoff(self, retries):
+        sleep(1 * 2 ** retries)
+
+
+class RateController:
+    """
+    A drop-in replacement for Throttler that adapts to how the server is responding, AIMD style: a token bucket whose
+    rate grows by increase with every clean response, and gets multiplied by decrease on every transient error
+    (gateway or volume timeout, network error), or by bot_decrease when glassdoor suspects us of being a bot.
+    Errors also start a backoff that doubles with each consecutive error (up to max_backoff), during which nobody using
+    the controller sends anything; unlike Throttler's, it's shared by every thread instead of each sleeping on its own.
+    With a path, the state lives in that file (under an flock) instead, so every process using the same file shares
+    one budget; see for_host.
+    Like Throttler, it doesn't space requests out evenly, which would be easy to tell apart from a human: each request
+    takes up a random amount of the budget, so (bursts aside) the gaps between requests are minimum_delay plus an
+    exponentially distributed amount, while still averaging out to the rate. So that there's always room for the
+    latter, max_rate is capped at 1 / (2 * minimum_delay). It defaults to Throttler's average rate, which is known to
+    be safe (faster than that drew bot warnings, and a bot warning aborts the sweep), so by default the controller only
+    slows down on errors, and works its way back up from there.
+    Rates are in requests per second, durations in seconds.
+    """
+    def __init__(self, rate=1 / 3, min_rate=1 / 60, max_rate=1 / 3, increase=0.01, decrease=0.5, bot_decrease=0.1,
+                 burst=1, max_backoff=15 * 60, path=None, minimum_delay=0.673):
+        if minimum_delay:
+            max_rate = min(max_rate, 1 / (2 * minimum_delay))
+        self.initial_rate = min(rate, max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.bot_decrease = bot_decrease
+        self.burst = burst
+        self.max_backoff = max_backoff
+        self.path = path
+        self.minimum_delay = minimum_delay
+        self.lock = threading.Lock()
+        self.state = self.initial_state()
+
+    @classmethod
+    def for_host(cls, host="www.glassdoor.com", **kwargs):
+        # a controller whose budget is shared with every other one for the same host, across processes
+        return cls(path=default_data_path("rate-%s.json" % host), **kwargs)
+
+    def initial_state(self):
+        return {"rate": self.initial_rate, "tokens": self.burst, "updated": time.time(), "backoff_until": 0,
+                "errors": 0}
+
+    def _update(self, change):
+        # applies change to the (possibly shared) state, atomically, and returns what it returns
+        with self.lock:
+            if self.path is None:
+                return change(self.state)
+            import fcntl  # only here, so that the module still imports where there's no fcntl (windows)
+            with os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT), "r+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+                try:
+                    self.state = json.load(f)
+                except ValueError:
+                    self.state = self.initial_state()  # a new file
+                result = change(self.state)
+                f.seek(0)
+                f.truncate()
+                json.dump(self.state, f)
+            return result
+
+    def _cost(self, rate):
+        # how many tokens a request takes: a gap of minimum_delay plus an exponentially distributed one (as in
+        # Throttler), in tokens, which averages out to 1 (max_rate leaves at least minimum_delay for the latter)
+        return (self.minimum_delay + random.expovariate(1 / (1 / rate - self.minimum_delay))) * rate
+
+    def _reserve(self, state):
+        # takes a request's tokens, possibly ones that'll only be there in the future; returns how long to wait for them
+        now = time.time()
+        state["tokens"] = min(self.burst, state["tokens"] + (now - state["updated"]) * state["rate"]) - \
+            self._cost(state["rate"])
+        state["updated"] = now
+        return max(-state["tokens"] / state["rate"], state["backoff_until"] - now, 0)
+
+    def throttle(self, func):
+        sleep(self._update(self._reserve))
+        return func()
+
+    def success(self):
+        def change(state):
+            state["rate"] = min(self.max_rate, state["rate"] + self.increase)
+            state["errors"] = 0
+        self._update(change)
+
+    def failure(self, error):
+        def change(state):
+            decrease = self.bot_decrease if isinstance(error, TerminalScrapeError) else self.decrease
+            state["rate"] = max(self.min_rate, state["rate"] * decrease)
+            state["tokens"] = min(state["tokens"], 0)
+            state["errors"] += 1
+            backoff = min(self.max_backoff, 2 ** (state["errors"] - 1))
+            state["backoff_until"] = max(state["backoff_until"], time.time() + backoff)
+        self._update(change)
+
+    def backoff(self, retries):
+        pass  # the next throttle() waits out the shared backoff
+
+    def status(self):
+        # the current rate (requests per second), tokens, consecutive errors, and seconds of backoff left
+        state = self._update(dict)
+        state["backoff_remaining"] = max(0, state["backoff_until"] - time.time())
+        return state
+
+    @property
+    def rate(self):
+        return self.status()["rate"]
+
 
 class ProgressTracker:
     """
     A multi-level, strictly hierarchical progress tracker.
     "Processing location 1/2, keyword 2/4, industry 5/13, page 12, job 28/30"
+    Levels that haven't started yet (at 0) aren't rendered.
+    Besides the levels, it counts finished units (jobs), and how many are expected (the jobs glassdoor promised for the
+    searches we've started so far), for a rate and an ETA; see status().
+    Progress is printed (and, with a path, written to a json file that other processes can read()) whenever the
+    autoprint granularity level moves, but at most once every interval seconds.
     """
-    def __init__(self, order=None, autoprint=True, autoprint_granularity=None):
+    def __init__(self, order=None, autoprint=True, autoprint_granularity=None, interval=1.0, path=None, unit="job"):
         self.order = order or []
+        self.positions = {name: index for index, name in enumerate(self.order)}
         self.current = defaultdict(int)
         self.total = {}
         self.autoprint = autoprint
         self.autoprint_granularity = autoprint_granularity
+        self.interval = interval
+        self.path = path
+        self.unit = unit
+        self.expected = 0
+        self.done = 0
+        self.finished = False
+        self.completions = deque(maxlen=100)  # when the latest units were done, for the rate
+        self.last_emitted = None
+        self.listeners = []  # called with status() whenever progress is printed
+        self.lock = threading.RLock()
 
     def set_total(self, name, total):
-        self.register_name(name)
-        self.total[name] = total
+        with self.lock:
+            self.register_name(name)
+            self.total[name] = total
 
     def set_current(self, name, total):
-        self.register_name(name)
-        self.current[name] = total
+        with self.lock:
+            self.register_name(name)
+            self.current[name] = total
 
     def increment(self, name, by=1):
-        self.register_name(name)
-        self.current[name] += by
-        self.decrement_later(name)
-        if self.autoprint:
-            self.handle_autoprint(name)
+        with self.lock:
+            self.register_name(name)
+            self.current[name] += by
+            self.decrement_later(name)
+            if name == self.unit:
+                self.done += by
+                self.completions.append(time.monotonic())
+        self.handle_autoprint(name)
+
+    def expect(self, count):
+        # count more units are on their way
+        with self.lock:
+            self.expected += count
 
     def decrement_later(self, name):
-        for n in self.order[self.order.index(name)+1:]:
+        for n in self.order[self.positions[name]+1:]:
             self.current[n] = 0
             self.total.pop(n, None)
 
     def handle_autoprint(self, name):
         granularity = self.autoprint_granularity or self.order[-1]
-        if name == granularity:
-            print(self.render(granularity))
+        if name != granularity:
+            return
+        now = time.monotonic()
+        if self.last_emitted is not None and now - self.last_emitted < self.interval:
+            return
+        self.last_emitted = now
+        self.emit()
+
+    def emit(self):
+        status = self.status()
+        if self.autoprint:
+            print(status["message"])
+        if self.path:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            with NamedTemporaryFile(mode='w', dir=directory, delete=False) as f:
+                json.dump(status, f)
+            os.replace(f.name, self.path)
+        for listener in self.listeners:
+            listener(status)
+
+    def finish(self):
+        # marks the sweep as over, and writes out the final status (without printing it)
+        with self.lock:
+            self.finished = True
+        autoprint, self.autoprint = self.autoprint, False
+        try:
+            self.emit()
+        finally:
+            self.autoprint = autoprint
+
+    @staticmethod
+    def read(path):
+        # the status() last written to path by a tracker in another process
+        with open(path) as f:
+            return json.load(f)
+
+    def rate(self):
+        # units per second, over the latest units
+        with self.lock:
+            if len(self.completions) < 2 or self.completions[-1] == self.completions[0]:
+                return None
+            return (len(self.completions) - 1) / (self.completions[-1] - self.completions[0])
+
+    def status(self):
+        # a json-serializable summary, for machines
+        with self.lock:
+            rate = self.rate()
+            remaining = max(self.expected - self.done, 0)
+            return {
+                "levels": [{"name": name, "current": self.current[name], "total": self.total.get(name)}
+                           for name in self.order],
+                "message": self.render(self.autoprint_granularity or (self.order[-1] if self.order else None)),
+                "unit": self.unit,
+                "done": self.done,
+                "expected": self.expected,
+                "rate": rate,
+                "eta": remaining / rate if rate else None,
+                "finished": self.finished,
+                "time": time.time(),
+            }
 
     # takewhile, except it returns the first failing value as well
     @staticmethod
@@ -102,19 +578,36 @@ class ProgressTracker:
 
     def render(self, granularity=None):
         components = []
-        for name in self.order:
-            trivial = name in self.total and self.current[name] == 1 and self.total[name] == 1
-            if not trivial:  # don't render 1/1, basically
-                components.append(self._render_name(name))
-            if name == granularity:
-                # and don't render anything below the requested granularity
-                break
+        with self.lock:
+            for name in self.order:
+                trivial = name in self.total and self.current[name] == 1 and self.total[name] == 1
+                if not trivial and self.current[name]:  # don't render 1/1 (or 0), basically
+                    components.append(self._render_name(name))
+                if name == granularity:
+                    # and don't render anything below the requested granularity
+                    break
         return "Processing " + ", ".join(components)
 
     def register_name(self, name):
-        if name not in self.order:
+        if name not in self.positions:
+            self.positions[name] = len(self.order)
             self.order.append(name)
 
+    def snapshot(self):
+        # a json-serializable copy of the current state, for restore()
+        with self.lock:
+            return {"order": list(self.order), "current": dict(self.current), "total": dict(self.total),
+                    "expected": self.expected, "done": self.done}
+
+    def restore(self, snapshot):
+        with self.lock:
+            self.order = list(snapshot["order"])
+            self.positions = {name: index for index, name in enumerate(self.order)}
+            self.current = defaultdict(int, snapshot["current"])
+            self.total = dict(snapshot["total"])
+            self.expected = snapshot.get("expected", 0)
+            self.done = snapshot.get("done", 0)
+
     def _render_name(self, name):
         total = self.total.get(name)
         current = self.current[name]
@@ -123,6 +616,1198 @@ class ProgressTracker:
         return "%s %s" % (name, current)
 
 
+class Metrics:
+    """
+    Counters and histograms of what a sweep spends its time on, per kind of request (search, details, salary,
+    location): how long requests waited on the throttle, how long the network took, how long parsing took, how many
+    bytes came back, and how many requests, retries, errors and cache hits there were.
+    report() sums it up, dump() writes it out as json, and prometheus() renders it in Prometheus' text format (which
+    serve() exposes over http, for scraping).
+    """
+    prefix = "glassdoor_"
+    second_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300]
+    byte_buckets = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)  # (name, kind) -> total
+        self.histograms = {}  # (name, kind) -> [bucket counts, sum, count]
+
+    def count(self, name, kind, by=1):
+        with self.lock:
+            self.counters[name, kind] += by
+
+    def observe(self, name, kind, value):
+        buckets = self.byte_buckets if name.endswith("_bytes") else self.second_buckets
+        with self.lock:
+            histogram = self.histograms.setdefault((name, kind), [[0] * len(buckets), 0, 0])
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        # a json-serializable copy: {"counters": {name: {kind: total}}, "histograms": {name: {kind: {...}}}}
+        counters = defaultdict(dict)
+        histograms = defaultdict(dict)
+        with self.lock:
+            for (name, kind), total in self.counters.items():
+                counters[name][kind] = total
+            for (name, kind), (buckets, total, count) in self.histograms.items():
+                histograms[name][kind] = {"buckets": list(buckets), "sum": total, "count": count}
+        return {"counters": dict(counters), "histograms": dict(histograms)}
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def prometheus(self):
+        lines = []
+        snapshot = self.snapshot()
+        for name, kinds in sorted(snapshot["counters"].items()):
+            lines.append("# TYPE %s%s counter" % (self.prefix, name))
+            for kind, total in sorted(kinds.items()):
+                lines.append('%s%s{kind="%s"} %s' % (self.prefix, name, kind, total))
+        for name, kinds in sorted(snapshot["histograms"].items()):
+            bounds = self.byte_buckets if name.endswith("_bytes") else self.second_buckets
+            lines.append("# TYPE %s%s histogram" % (self.prefix, name))
+            for kind, histogram in sorted(kinds.items()):
+                cumulative = 0
+                for bound, bucket in zip(bounds, histogram["buckets"]):
+                    cumulative += bucket
+                    lines.append('%s%s_bucket{kind="%s",le="%s"} %d' % (self.prefix, name, kind, bound, cumulative))
+                lines.append('%s%s_bucket{kind="%s",le="+Inf"} %d' % (self.prefix, name, kind, histogram["count"]))
+                lines.append('%s%s_sum{kind="%s"} %s' % (self.prefix, name, kind, histogram["sum"]))
+                lines.append('%s%s_count{kind="%s"} %d' % (self.prefix, name, kind, histogram["count"]))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9100, host="127.0.0.1"):
+        # serves prometheus() on http://host:port/metrics from a background thread; returns the server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def report(self):
+        # where the time went, per kind of request: whether a sweep is throttle, network or parse bound
+        snapshot = self.snapshot()
+        histograms = snapshot["histograms"]
+        kinds = sorted(set(kind for kinds in histograms.values() for kind in kinds))
+        lines = ["%-10s %9s %8s %12s %12s %12s %10s" % ("kind", "requests", "retries", "throttle (s)", "network (s)",
+                                                         "parse (s)", "MiB")]
+        for kind in kinds:
+            def total(name):
+                return histograms.get(name, {}).get(kind, {}).get("sum", 0)
+            lines.append("%-10s %9d %8d %12.2f %12.2f %12.2f %10.2f" % (
+                kind, snapshot["counters"].get("requests_total", {}).get(kind, 0),
+                snapshot["counters"].get("retries_total", {}).get(kind, 0), total("throttle_wait_seconds"),
+                total("request_seconds"), total("parse_seconds"), total("response_bytes") / 2 ** 20))
+        return "\n".join(lines)
+
+
+def default_data_path(filename):
+    # somewhere under $XDG_CACHE_HOME to keep our persistent state in, if the caller doesn't care where
+    directory = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "glassdoor-scraper")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, filename)
+
+
+class CachedResponse:
+    # quacks enough like a requests.Response for everything that consumes our responses
+    def __init__(self, url, text, status_code=200):
+        self.url = url
+        self.text = text
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class Transport:
+    # how searches talk to the network; a single transport (and its headers, like the Referer) is shared by a search
+    # and all of its sub-searches
+    headers = None
+
+    def request(self, method, url, **kwargs):
+        raise NotImplementedError
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+class HTTPTransport(Transport):
+    # a requests session, with a keep-alive connection pool big enough for all of a search's worker threads
+    default_headers = {
+        'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
+        'accept-encoding': 'gzip, deflate, br',
+        'accept-language': 'en-GB,en;q=0.9,en-US;q=0.8',
+        'cache-control': 'no-cache',
+        'connection': 'keep-alive',
+        'host': 'www.glassdoor.com',
+        'upgrade-insecure-requests': '1',
+        'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2227.1 Safari/537.36',
+    }
+
+    origin = "https://www.glassdoor.com"
+
+    # adapter is another HTTPTransport's, to share its connection pool (but not its headers) with
+    def __init__(self, pool_size=16, headers=None, proxies=None, base_url=None, adapter=None):
+        import requests.adapters
+        self.session = requests.Session()
+        self.session.headers = dict(self.default_headers, **(headers or {}))
+        if proxies:
+            self.session.proxies.update(proxies)
+        # base_url sends every request for glassdoor to a stand-in for it instead, e.g. a local test server
+        self.base_url = base_url.rstrip("/") if base_url else None
+        if self.base_url:
+            self.session.headers['host'] = urlsplit(self.base_url).netloc
+        self.adapter = adapter or requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def request(self, method, url, **kwargs):
+        if self.base_url and url.startswith(self.origin):
+            url = self.base_url + url[len(self.origin):]
+        return self.session.request(method, url, **kwargs)
+
+
+class RecordingTransport(Transport):
+    """
+    Passes requests through to another transport, and writes every response into an archive directory, which
+    ReplayTransport can later serve them from.
+    The archive is an index.jsonl (one line per request: method, url, params, data, the response's url and status
+    code, and the file its body is in) plus one file per response body.
+    """
+    def __init__(self, archive, transport=None):
+        self.archive = archive
+        self.transport = transport or HTTPTransport()
+        self.lock = threading.Lock()
+        os.makedirs(archive, exist_ok=True)
+
+    @property
+    def headers(self):
+        return self.transport.headers
+
+    def request(self, method, url, **kwargs):
+        response = self.transport.request(method, url, **kwargs)
+        key = ResponseCache.key(method, url, kwargs.get("params"), kwargs.get("data"))
+        with self.lock:
+            with open(os.path.join(self.archive, key + ".html"), "w") as f:
+                f.write(response.text)
+            with open(os.path.join(self.archive, "index.jsonl"), "a") as f:
+                f.write(json.dumps({"method": method, "url": url, "params": kwargs.get("params"),
+                                    "data": kwargs.get("data"), "response_url": response.url,
+                                    "status_code": response.status_code, "file": key + ".html"}, default=str) + "\n")
+        return response
+
+
+class ReplayTransport(Transport):
+    # serves responses out of a RecordingTransport archive, without touching the network
+    # a request that was never recorded is a ReplayMissError
+    def __init__(self, archive):
+        self.archive = archive
+        self.headers = {}
+        self.responses = {}
+        index_path = os.path.join(archive, "index.jsonl")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    key = ResponseCache.key(entry["method"], entry["url"], entry.get("params"), entry.get("data"))
+                    self.responses[key] = entry
+
+    def read(self, name):
+        with open(os.path.join(self.archive, name)) as f:
+            return f.read()
+
+    def request(self, method, url, **kwargs):
+        entry = self.responses.get(ResponseCache.key(method, url, kwargs.get("params"), kwargs.get("data")))
+        if entry is None:
+            return self.missing(method, url, **kwargs)
+        return CachedResponse(entry.get("response_url", entry["url"]), self.read(entry["file"]),
+                              entry.get("status_code", 200))
+
+    def missing(self, method, url, **kwargs):
+        raise ReplayMissError("No recorded response for %s %s" % (method, url))
+
+
+class ParsedResponse:
+    """
+    A response, and its html parse tree. The tree is built at most once, the first time something asks for it, and is
+    then shared by the error checking, pagination and scraping code.
+    The error and not-found markers (Extractors.page_markers) are all found in a single pass over the text, also on
+    first use.
+    """
+    def __init__(self, response, metrics=None, kind=None):
+        self.response = response
+        self.url = response.url
+        self.text = response.text
+        self.status_code = response.status_code
+        # where to record how long parsing took, if anywhere
+        self.metrics = metrics
+        self.kind = kind
+        self._tree = None
+        self._markers = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            start = time.perf_counter()
+            from lxml import html
+            self._tree = html.fromstring(self.text)
+            if self.metrics is not None:
+                self.metrics.observe("parse_seconds", self.kind, time.perf_counter() - start)
+        return self._tree
+
+    @property
+    def markers(self):
+        # the names of all the markers present in the text
+        if self._markers is None:
+            self._markers = {match.lastgroup for match in extractors.page_markers.finditer(self.text)}
+        return self._markers
+
+    def json(self):
+        return self.response.json()
+
+
+class SQLiteStore:
+    """
+    What the persistent stores below have in common: a sqlite database at path (by default, filename in
+    default_data_path()), with the tables in schema created if they don't exist yet, and a lock to share its
+    connection between threads.
+    """
+    filename = None
+    schema = []
+
+    def __init__(self, path=None):
+        self.path = path or default_data_path(self.filename)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        for statement in self.schema:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class ResponseCache(SQLiteStore):
+    """
+    An on-disk (sqlite) cache of response bodies, sitting in front of BaseSearch.get/post.
+    Only requests of a kind with a ttl (in seconds) get cached; search pages are never cached, since their content
+    changes from day to day.
+    Bodies are stored zlib compressed; once the cache grows past max_bytes (of compressed bodies), the least recently
+    used entries get evicted.
+    """
+    default_ttls = {
+        "details": 7 * 24 * 60 * 60,  # a listing's details practically never change
+        "salary": 7 * 24 * 60 * 60,
+        "location": 90 * 24 * 60 * 60,
+    }
+    filename = "responses.sqlite"
+    schema = ["CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, kind TEXT, url TEXT, status_code INTEGER, "
+              "body BLOB, size INTEGER, created REAL, accessed REAL)",
+              "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"]
+
+    def __init__(self, path=None, ttls=None, max_bytes=1024 ** 3):
+        super().__init__(path)
+        self.ttls = dict(self.default_ttls, **(ttls or {}))
+        self.max_bytes = max_bytes
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def key(method, url, params=None, data=None):
+        canonical = json.dumps([method, url, sorted((params or {}).items()), sorted((data or {}).items())],
+                               default=str)
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def caches(self, kind):
+        return bool(self.ttls.get(kind))
+
+    def lookup(self, kind, key):
+        with self.lock:
+            row = self.db.execute("SELECT url, status_code, body, created FROM responses WHERE key = ?",
+                                  (key,)).fetchone()
+            if row is None:
+                return None
+            url, status_code, body, created = row
+            now = time.time()
+            if created + self.ttls[kind] < now:
+                self._delete(key)
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return CachedResponse(url, zlib.decompress(body).decode(), status_code)
+
+    def store(self, kind, key, response):
+        body = zlib.compress(response.text.encode())
+        now = time.time()
+        with self.lock:
+            self._delete(key)
+            self.db.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (key, kind, response.url, response.status_code, body, len(body), now, now))
+            self.size += len(body)
+            if self.size > self.max_bytes:
+                self._evict()
+            self.db.commit()
+
+    def _delete(self, key):
+        row = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row:
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= row[0]
+
+    def _evict(self):
+        # evict down to 90% of the limit, so we don't end up evicting on every single store
+        for key, size in self.db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if self.size <= self.max_bytes * 0.9:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= size
+
+
+class ListingIndex(SQLiteStore):
+    """
+    An index of every listing we've scraped: listing_id -> when we last saw it, when we last scraped
+    its details page, and a hash of its search result summary.
+    Used for incremental re-scrapes; a listing whose summary hasn't changed, and whose details were scraped less than
+    max_age seconds ago, doesn't get its details page (or salary page) fetched again.
+    """
+    filename = "listings.sqlite"
+    schema = ["CREATE TABLE IF NOT EXISTS listings (listing_id TEXT PRIMARY KEY, content_hash TEXT, first_seen REAL, "
+              "last_seen REAL, last_scraped REAL)"]
+
+    def __init__(self, path=None, max_age=14 * 24 * 60 * 60):
+        super().__init__(path)
+        self.max_age = max_age
+
+    @staticmethod
+    def content_hash(listing, salary_range=None):
+        # only the fields shown in the search results; requested_location (and the url's tracking params) vary
+        # from query to query without the listing itself changing
+        summary = [listing.get(k) for k in ["title", "company", "location"]] + [salary_range]
+        return hashlib.sha1(json.dumps(summary).encode()).hexdigest()
+
+    def is_fresh(self, listing_id, content_hash):
+        with self.lock:
+            row = self.db.execute("SELECT content_hash, last_scraped FROM listings WHERE listing_id = ?",
+                                  (listing_id,)).fetchone()
+        return (row is not None and row[0] == content_hash and row[1] is not None
+                and row[1] + self.max_age >= time.time())
+
+    def record(self, listing_id, content_hash, scraped):
+        # scraped is whether we've just (re-)scraped the listing's details page
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR IGNORE INTO listings VALUES (?, ?, ?, ?, NULL)",
+                            (listing_id, content_hash, now, now))
+            self.db.execute("UPDATE listings SET content_hash = ?, last_seen = ? WHERE listing_id = ?",
+                            (content_hash, now, listing_id))
+            if scraped:
+                self.db.execute("UPDATE listings SET last_scraped = ? WHERE listing_id = ?", (now, listing_id))
+            self.db.commit()
+
+
+class ListingRegistry:
+    """
+    Every listing a sweep has turned up so far, by listing_id, so that each one's details (and salary) are scraped once
+    per sweep, however many keywords, locations or re-queries find it again. The first copy of a listing is the one that
+    gets scraped and emitted; every copy (the first one included) adds its keyword and requested location to the first
+    copy's keywords and requested_locations lists.
+    Since the first copy may well have been emitted already by the time a later one turns up, every new (listing_id,
+    keyword, requested_location) attribution is also passed to listener, for sinks and checkpoints to record apart.
+    Only those two lists of each listing are kept (shared with the emitted listing), not the listing itself, so a
+    streamed sweep doesn't hold on to every listing and description it has emitted.
+    """
+    def __init__(self, listings=(), attributions=(), listener=None):
+        self.lock = threading.Lock()
+        # listing_id -> the (keywords, requested_locations) lists of its first copy
+        self.listings = {listing["listing_id"]: self.attribution_lists(listing) for listing in listings}
+        self.attributions = set(map(tuple, attributions))  # the ones a previous run already recorded
+        self.listener = listener
+
+    @staticmethod
+    def attribution_lists(listing):
+        return listing.setdefault("keywords", []), listing.setdefault("requested_locations", [])
+
+    @staticmethod
+    def add_attribution(lists, keyword, location):
+        for values, value in zip(lists, (keyword, location)):
+            if value not in values:
+                values.append(value)
+
+    @classmethod
+    def attribute(cls, listing, keyword, location):
+        cls.add_attribution(cls.attribution_lists(listing), keyword, location)
+
+    def claim(self, listing, keyword, location):
+        # returns whether this is the first copy of the listing, which the caller should then scrape and emit
+        attribution = (listing["listing_id"], keyword, location)
+        with self.lock:
+            lists = self.listings.get(listing["listing_id"])
+            first = lists is None
+            if first:
+                lists = self.listings[listing["listing_id"]] = self.attribution_lists(listing)
+            self.add_attribution(lists, keyword, location)
+            new = attribution not in self.attributions
+            self.attributions.add(attribution)
+        if new and self.listener is not None:
+            self.listener(*attribution)
+        return first
+
+    def __contains__(self, listing_id):
+        return listing_id in self.listings
+
+    def __len__(self):
+        return len(self.listings)
+
+
+class DescriptionStore(SQLiteStore):
+    """
+    A content-addressed store of listing descriptions, which are by far the biggest field, and often the same
+    boilerplate for many listings. Each description is normalized (whitespace collapsed, blank lines dropped) and
+    stored once, zlib compressed, under the sha1 of its text; listings keep only that hash, in description_hash, and
+    their text is loaded on demand with get(hash) or description(listing).
+    train_dictionary() builds a zlib dictionary out of the descriptions stored so far, which every description stored
+    after it is compressed with.
+    """
+    filename = "descriptions.sqlite"
+    schema = ["CREATE TABLE IF NOT EXISTS dictionaries (id INTEGER PRIMARY KEY, data BLOB)",
+              "CREATE TABLE IF NOT EXISTS descriptions (hash TEXT PRIMARY KEY, dictionary INTEGER, body BLOB, "
+              "size INTEGER)"]
+
+    def __init__(self, path=None, level=9):
+        super().__init__(path)
+        self.level = level
+        self.dictionaries = dict(self.db.execute("SELECT id, data FROM dictionaries"))
+        self.dictionary_id = max(self.dictionaries, default=None)  # the one new descriptions get compressed with
+        self.known = set()  # hashes we've stored (or found stored) in this process
+
+    @staticmethod
+    def normalize(text):
+        return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+    def put(self, text):
+        # stores a description, unless it's already stored; returns its hash
+        text = self.normalize(text)
+        digest = hashlib.sha1(text.encode()).hexdigest()
+        with self.lock:
+            if digest in self.known:
+                return digest
+            if self.db.execute("SELECT 1 FROM descriptions WHERE hash = ?", (digest,)).fetchone() is None:
+                body = text.encode()
+                self.db.execute("INSERT INTO descriptions VALUES (?, ?, ?, ?)",
+                                (digest, self.dictionary_id, self.compress(body, self.dictionary_id), len(body)))
+                self.db.commit()
+            self.known.add(digest)
+        return digest
+
+    def get(self, digest):
+        # a description's text, or None if it isn't stored
+        with self.lock:
+            row = self.db.execute("SELECT dictionary, body FROM descriptions WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        dictionary = self.dictionaries.get(row[0])
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return (decompressor.decompress(row[1]) + decompressor.flush()).decode()
+
+    def description(self, listing):
+        # a listing's description, whether it has the text itself or just its hash
+        if "description" in listing:
+            return listing["description"]
+        digest = listing.get("description_hash")
+        return self.get(digest) if digest else None
+
+    def compress(self, body, dictionary_id):
+        dictionary = self.dictionaries.get(dictionary_id)
+        compressor = (zlib.compressobj(self.level, zdict=dictionary) if dictionary else
+                      zlib.compressobj(self.level))
+        return compressor.compress(body) + compressor.flush()
+
+    def train_dictionary(self, size=32 * 1024, samples=1000):
+        # zlib can't train a dictionary, but it can use one: here, the lines that recur most across the latest samples
+        # descriptions (i.e. boilerplate), with the most common ones last, where zlib finds them cheapest
+        # size can be at most zlib's 32KiB window; returns the dictionary, or None if nothing recurs
+        with self.lock:
+            digests = self.db.execute("SELECT hash FROM descriptions ORDER BY rowid DESC LIMIT ?",
+                                      (samples,)).fetchall()
+        counts = Counter()
+        for (digest,) in digests:
+            counts.update(set(self.get(digest).splitlines()))
+        lines = []
+        remaining = size
+        for line, count in counts.most_common():
+            encoded = (line + "\n").encode()
+            if count < 2 or remaining <= 0:
+                break
+            if len(encoded) <= remaining:
+                lines.append(encoded)
+                remaining -= len(encoded)
+        if not lines:
+            return None
+        dictionary = b"".join(reversed(lines))
+        with self.lock:
+            self.dictionary_id = self.db.execute("INSERT INTO dictionaries (data) VALUES (?)", (dictionary,)).lastrowid
+            self.db.commit()
+            self.dictionaries[self.dictionary_id] = dictionary
+        return dictionary
+
+    def stats(self):
+        with self.lock:
+            count, size, compressed = self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM descriptions").fetchone()
+        return {"descriptions": count, "bytes": size, "compressed_bytes": compressed}
+
+
+class Checkpoint:
+    """
+    Durable progress of a Search, so that a sweep that died halfway through can continue where it stopped.
+    The cursor (the location, keyword, industry and next page url we're at, plus the progress tracker's state) is
+    atomically rewritten after every page. Listings are appended to a jsonl file next to it as they're emitted, and
+    (listing_id, keyword, requested_location) attributions (see ListingRegistry) to another one.
+    When a sweep is exported, sink is set to its Sink; listings and attributions are then only recorded once the sink
+    has written them (when the cursor is saved, right after flushing the sink), since a listing the checkpoint has
+    recorded is skipped when resuming.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.listings_path = path + ".listings"
+        self.attributions_path = path + ".attributions"
+        self.cursor = None
+        self.progress = None
+        self.listings = []
+        self.attributions = []
+        self.sink = None
+        self.pending = []  # (file, record) pairs waiting for the sink to write them
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+            self.cursor = state["cursor"]
+            self.progress = state["progress"]
+        if os.path.exists(self.listings_path):
+            self.listings = self._read_jsonl(self.listings_path)
+        for listing in self.listings:
+            if "salary" in listing:
+                listing["salary"] = tuple(listing["salary"])
+        if os.path.exists(self.attributions_path):
+            self.attributions = [tuple(attribution) for attribution in self._read_jsonl(self.attributions_path)]
+        by_id = {listing["listing_id"]: listing for listing in self.listings}
+        for listing_id, keyword, location in self.attributions:
+            if listing_id in by_id:
+                ListingRegistry.attribute(by_id[listing_id], keyword, location)
+        self.listings_file = open(self.listings_path, "a")
+        self.attributions_file = open(self.attributions_path, "a")
+
+    @staticmethod
+    def _read_jsonl(path):
+        records = []
+        valid_bytes = 0
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break  # we died halfway through writing this one
+                valid_bytes += len(line)
+        os.truncate(path, valid_bytes)
+        return records
+
+    @property
+    def done(self):
+        return bool(self.cursor and self.cursor.get("done"))
+
+    def emit(self, listing):
+        self._record(self.listings_file, listing)
+
+    def attribute(self, listing_id, keyword, requested_location):
+        self._record(self.attributions_file, [listing_id, keyword, requested_location])
+
+    def _record(self, f, record):
+        if self.sink is not None:
+            self.pending.append((f, record))
+            return
+        f.write(json.dumps(record) + "\n")
+        f.flush()
+
+    def _record_pending(self):
+        if self.sink is not None:
+            self.sink.flush()
+        for f, record in self.pending:
+            f.write(json.dumps(record) + "\n")
+        self.pending = []
+
+    def save(self, cursor, progress_snapshot):
+        self._record_pending()
+        # the listings and attributions files have to hit the disk before the cursor that accounts for them does
+        for f in (self.listings_file, self.attributions_file):
+            f.flush()
+            os.fsync(f.fileno())
+        self.cursor = cursor
+        self.progress = progress_snapshot
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with NamedTemporaryFile(mode='w', dir=directory, delete=False) as f:
+            json.dump({"cursor": cursor, "progress": progress_snapshot}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, self.path)
+
+    def close(self):
+        self._record_pending()
+        self.listings_file.close()
+        self.attributions_file.close()
+
+
+class Sink:
+    """
+    Somewhere to write listings to, in batches of batch_size. Use it as a context manager (or call close()), so the
+    last, partial batch gets written too.
+    Descriptions are by far the biggest field, so every sink keeps them apart from the other fields, keyed by
+    listing_id; scans over the rest (salary, rating, ...) then don't have to read through them.
+    Which keywords and requested locations found each listing (see ListingRegistry) are kept apart too, as one
+    (listing_id, keyword, requested_location) row per attribution, since they keep turning up after the listing itself
+    was written.
+    """
+    # the columns every listing is flattened to; salary becomes salary_low and salary_high
+    columns = ["listing_id", "title", "company", "location", "requested_location", "city", "state", "url", "rating",
+               "salary_low", "salary_high", "salary_sample_size", "description_hash"]
+    attribution_columns = ["listing_id", "keyword", "requested_location"]
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.batch = []
+        self.attributions = []
+
+    def write(self, listing):
+        self.batch.append(listing)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def write_attribution(self, listing_id, keyword, requested_location):
+        self.attributions.append(dict(zip(self.attribution_columns, (listing_id, keyword, requested_location))))
+        if len(self.attributions) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.write_batch(self.batch)
+            self.batch = []
+        if self.attributions:
+            self.write_attributions(self.attributions)
+            self.attributions = []
+
+    def write_batch(self, listings):
+        raise NotImplementedError
+
+    def write_attributions(self, attributions):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @classmethod
+    def row(cls, listing):
+        salary = listing.get("salary") or (None, None)
+        return dict({column: listing.get(column) for column in cls.columns}, salary_low=salary[0],
+                    salary_high=salary[1])
+
+
+class JSONLSink(Sink):
+    # appends one json object per listing to path, descriptions to path + ".descriptions", and attributions to
+    # path + ".attributions"
+    def __init__(self, path, batch_size=1000):
+        super().__init__(batch_size)
+        self.file = open(path, "a")
+        self.descriptions_file = open(path + ".descriptions", "a")
+        self.attributions_file = open(path + ".attributions", "a")
+
+    def write_batch(self, listings):
+        self.file.write("".join(json.dumps(self.row(listing)) + "\n" for listing in listings))
+        self.descriptions_file.write("".join(
+            json.dumps({"listing_id": listing["listing_id"], "description": listing["description"]}) + "\n"
+            for listing in listings if "description" in listing))
+        self.file.flush()
+        self.descriptions_file.flush()
+
+    def write_attributions(self, attributions):
+        self.attributions_file.write("".join(json.dumps(attribution) + "\n" for attribution in attributions))
+        self.attributions_file.flush()
+
+    def close(self):
+        super().close()
+        self.file.close()
+        self.descriptions_file.close()
+        self.attributions_file.close()
+
+
+class SQLiteSink(Sink):
+    # inserts listings into a listings table, descriptions into a descriptions table, and attributions into an
+    # attributions table; one transaction per batch
+    def __init__(self, path, batch_size=1000):
+        super().__init__(batch_size)
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS listings (listing_id TEXT PRIMARY KEY, title TEXT, company TEXT, "
+                        "location TEXT, requested_location TEXT, city TEXT, state TEXT, url TEXT, rating REAL, "
+                        "salary_low REAL, salary_high REAL, salary_sample_size INTEGER, description_hash TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS descriptions (listing_id TEXT PRIMARY KEY, description TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS attributions (listing_id TEXT, keyword TEXT, "
+                        "requested_location TEXT, PRIMARY KEY (listing_id, keyword, requested_location))")
+        self.db.commit()
+
+    def write_batch(self, listings):
+        # a listing we've written before only updates the columns it has values for; e.g. a listing whose details
+        # weren't scraped again (see ListingIndex) keeps the salary it was written with last time
+        upsert = "INSERT INTO listings VALUES (%s) ON CONFLICT(listing_id) DO UPDATE SET %s" % (
+            ", ".join("?" * len(self.columns)),
+            ", ".join("%s = COALESCE(excluded.%s, %s)" % (column, column, column) for column in self.columns[1:]))
+        with self.db:
+            self.db.executemany(upsert, ([self.row(listing)[column] for column in self.columns]
+                                         for listing in listings))
+            self.db.executemany("INSERT OR REPLACE INTO descriptions VALUES (?, ?)",
+                                ((listing["listing_id"], listing["description"])
+                                 for listing in listings if "description" in listing))
+
+    def write_attributions(self, attributions):
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO attributions VALUES (?, ?, ?)",
+                                ([attribution[column] for column in self.attribution_columns]
+                                 for attribution in attributions))
+
+    def close(self):
+        super().close()
+        self.db.close()
+
+
+class ArrowSink(Sink):
+    """
+    Writes listings to an Arrow IPC stream file, one record batch per batch; descriptions go to a second file, with
+    just listing_id and description columns, and attributions to a third one. Needs pyarrow.
+    The low-cardinality string columns (company, city, ...) are dictionary encoded. (It's the stream format rather
+    than the random access one, because that one doesn't allow a new dictionary per batch.)
+    """
+    dictionary_columns = ["company", "requested_location", "city", "state"]
+    float_columns = ["rating", "salary_low", "salary_high"]
+    int_columns = ["salary_sample_size"]
+
+    def __init__(self, path, descriptions_path=None, batch_size=1000, attributions_path=None):
+        super().__init__(batch_size)
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("%s needs pyarrow installed" % type(self).__name__)
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+            (column, pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) if column in self.dictionary_columns else
+             pyarrow.float64() if column in self.float_columns else
+             pyarrow.int64() if column in self.int_columns else pyarrow.string())
+            for column in self.columns])
+        self.descriptions_schema = pyarrow.schema([("listing_id", pyarrow.string()),
+                                                   ("description", pyarrow.string())])
+        self.writer = self.open_writer(path, self.schema)
+        self.descriptions_writer = self.open_writer(descriptions_path or self.descriptions_path(path),
+                                                    self.descriptions_schema)
+        self.attributions_schema = pyarrow.schema([(column, pyarrow.string()) for column in self.attribution_columns])
+        self.attributions_writer = self.open_writer(attributions_path or self.attributions_path(path),
+                                                    self.attributions_schema)
+
+    @staticmethod
+    def descriptions_path(path):
+        root, extension = os.path.splitext(path)
+        return root + ".descriptions" + extension
+
+    @staticmethod
+    def attributions_path(path):
+        root, extension = os.path.splitext(path)
+        return root + ".attributions" + extension
+
+    def open_writer(self, path, schema):
+        return self.pa.ipc.new_stream(path, schema)
+
+    def write_batch(self, listings):
+        rows = [self.row(listing) for listing in listings]
+        self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+        self.descriptions_writer.write_table(self.pa.Table.from_pylist(
+            [{"listing_id": listing["listing_id"], "description": listing["description"]}
+             for listing in listings if "description" in listing], schema=self.descriptions_schema))
+
+    def write_attributions(self, attributions):
+        self.attributions_writer.write_table(self.pa.Table.from_pylist(attributions, schema=self.attributions_schema))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+        self.descriptions_writer.close()
+        self.attributions_writer.close()
+
+
+class ParquetSink(ArrowSink):
+    # the same as ArrowSink, but writes parquet files, one row group per batch
+    def open_writer(self, path, schema):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(path, schema)
+
+
+class PartitionCounts(SQLiteStore):
+    """
+    A record of how many jobs glassdoor promised for each search partition (a keyword, location
+    and set of filters), and which sub-partitions it was split into, if it was too big to page through.
+    Lets the planner in SingleSearch skip partitions that were empty last time, and split partitions that were too
+    big last time without first querying them again. Entries older than max_age seconds are ignored.
+    """
+    filename = "partitions.sqlite"
+    schema = ["CREATE TABLE IF NOT EXISTS partitions (key TEXT PRIMARY KEY, promised_jobs INTEGER, children TEXT, "
+              "updated REAL)"]
+
+    def __init__(self, path=None, max_age=3 * 24 * 60 * 60):
+        super().__init__(path)
+        self.max_age = max_age
+
+    def get(self, key):
+        # returns (promised jobs, sub-partition options or None), or None if we don't know (or it's stale)
+        with self.lock:
+            row = self.db.execute("SELECT promised_jobs, children, updated FROM partitions WHERE key = ?",
+                                  (key,)).fetchone()
+        if row is None or row[2] + self.max_age < time.time():
+            return None
+        return row[0], json.loads(row[1]) if row[1] else None
+
+    def record(self, key, promised_jobs, children=None):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO partitions VALUES (?, ?, ?, ?)",
+                            (key, promised_jobs, json.dumps(children) if children else None, time.time()))
+            self.db.commit()
+
+
+class LocationIndex(SQLiteStore):
+    """
+    A map of location strings to glassdoor's (location type, location id), and of locations to the
+    salary filter options glassdoor offers for them, so neither gets looked up more than once every max_age seconds.
+    Location strings are normalized first, so "boston,  MA" and "Boston, MA" are the same location.
+    A path of ":memory:" keeps it for the lifetime of the object only; that's what searches use if not given one.
+    """
+    filename = "locations.sqlite"
+    schema = ["CREATE TABLE IF NOT EXISTS locations (term TEXT PRIMARY KEY, location_type TEXT, location_id INTEGER, "
+              "updated REAL)",
+              "CREATE TABLE IF NOT EXISTS salary_options (location_type TEXT, location_id INTEGER, options TEXT, "
+              "updated REAL, PRIMARY KEY (location_type, location_id))"]
+
+    def __init__(self, path=None, max_age=90 * 24 * 60 * 60):
+        super().__init__(path)
+        self.max_age = max_age
+
+    @staticmethod
+    def normalize(term):
+        return extractors.location_separator.sub(", ", " ".join(term.lower().split())).strip(", ")
+
+    def lookup(self, term):
+        # returns (location type, location id), or None
+        with self.lock:
+            row = self.db.execute("SELECT location_type, location_id FROM locations WHERE term = ? AND updated >= ?",
+                                  (self.normalize(term), time.time() - self.max_age)).fetchone()
+        return tuple(row) if row else None
+
+    def record(self, term, compound_id):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?)",
+                            (self.normalize(term), compound_id[0], compound_id[1], time.time()))
+
+    def salary_options(self, compound_id):
+        # returns the minimum salaries a search in this location can filter by (maybe none), or None if we don't know
+        with self.lock:
+            row = self.db.execute("SELECT options FROM salary_options WHERE location_type = ? AND location_id = ? "
+                                  "AND updated >= ?", (compound_id[0], compound_id[1],
+                                                       time.time() - self.max_age)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_salary_options(self, compound_id, options):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO salary_options VALUES (?, ?, ?, ?)",
+                            (compound_id[0], compound_id[1], json.dumps(options), time.time()))
+
+
+class SalaryIndex(SQLiteStore):
+    """
+    A table of the salaries glassdoor has shown us, per company salary page and location, so each
+    job title is searched for at most once per company and location.
+    Anonymous users only get the top three matches of a title search, so a company's table fills up one search at a
+    time: every row a search turns up is kept (and answers later lookups of that exact title), and titles that were
+    searched for without a match are remembered too. Entries older than max_age seconds are ignored.
+    """
+    filename = "salaries.sqlite"
+    schema = ["CREATE TABLE IF NOT EXISTS salaries (company TEXT, location TEXT, title TEXT, sample_size INTEGER, "
+              "low NUMERIC, high NUMERIC, updated REAL, PRIMARY KEY (company, location, title))",
+              "CREATE TABLE IF NOT EXISTS searches (company TEXT, location TEXT, title TEXT, updated REAL, "
+              "PRIMARY KEY (company, location, title))"]
+
+    def __init__(self, path=None, max_age=30 * 24 * 60 * 60):
+        super().__init__(path)
+        self.max_age = max_age
+
+    def lookup(self, company, location, title):
+        # returns (whether we know the answer, (salary_range, sample_size) or None)
+        since = time.time() - self.max_age
+        with self.lock:
+            row = self.db.execute("SELECT low, high, sample_size FROM salaries WHERE company = ? AND location = ? "
+                                  "AND title = ? AND updated >= ?", (company, location, title, since)).fetchone()
+            if row:
+                return True, ((row[0], row[1]), row[2])
+            searched = self.db.execute("SELECT 1 FROM searches WHERE company = ? AND location = ? AND title = ? "
+                                       "AND updated >= ?", (company, location, title, since)).fetchone()
+        return bool(searched), None
+
+    def record(self, company, location, title, rows):
+        # rows are the (title, sample size, salary range) rows a search for title turned up
+        now = time.time()
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO salaries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(company, location, row_title, sample_size, salary_range[0], salary_range[-1], now)
+                                 for row_title, sample_size, salary_range in rows])
+            self.db.execute("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)", (company, location, title, now))
+
+
+class WorkQueue:
+    """
+    A sqlite-backed queue of work units (a location, keyword, industry and employer size each) for the worker
+    processes of a Coordinator, shared through its file.
+    A worker leases a unit for lease_time seconds, and renews the lease every time it stores a listing. A unit whose
+    lease runs out (because its worker died or hung) goes back to the queue; a unit that failed max_attempts times is
+    given up on. Listings are stored in the same file, keyed (and so deduplicated) by listing_id, along with which
+    keywords and requested locations found them (see ListingRegistry), as one row per attribution.
+    """
+    def __init__(self, path, lease_time=10 * 60, max_attempts=3):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS units (id INTEGER PRIMARY KEY, location TEXT, keyword TEXT, "
+                        "industry_code TEXT, employer_size INTEGER, status TEXT DEFAULT 'pending', worker TEXT, "
+                        "lease_until REAL, attempts INTEGER DEFAULT 0, error TEXT, "
+                        "UNIQUE (location, keyword, industry_code, employer_size))")
+        self.db.execute("CREATE TABLE IF NOT EXISTS listings (listing_id TEXT PRIMARY KEY, unit INTEGER, "
+                        "listing TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS attributions (listing_id TEXT, keyword TEXT, "
+                        "requested_location TEXT, PRIMARY KEY (listing_id, keyword, requested_location))")
+        self.db.commit()
+
+    def put(self, location, keyword, industry_code=-1, employer_size=ES_ANY):
+        # queuing a unit that's already queued (or done) does nothing
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO units (location, keyword, industry_code, employer_size) "
+                            "VALUES (?, ?, ?, ?)", (location, keyword, str(industry_code), employer_size))
+
+    def lease(self, worker):
+        # returns (unit id, location, keyword, industry code, employer size), or None if nothing is up for grabs
+        now = time.time()
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("UPDATE units SET status = 'failed', error = 'lease ran out' "
+                            "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?", (now, self.max_attempts))
+            unit = self.db.execute("SELECT id, location, keyword, industry_code, employer_size FROM units "
+                                   "WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?) "
+                                   "ORDER BY id LIMIT 1", (now,)).fetchone()
+            if unit:
+                self.db.execute("UPDATE units SET status = 'leased', worker = ?, lease_until = ?, "
+                                "attempts = attempts + 1 WHERE id = ?", (worker, now + self.lease_time, unit[0]))
+        return unit
+
+    def store(self, unit_id, worker, listing):
+        # the first copy of a listing wins, like in a single-process sweep
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO listings VALUES (?, ?, ?)",
+                            (listing["listing_id"], unit_id, json.dumps(listing)))
+            self.db.execute("UPDATE units SET lease_until = ? WHERE id = ? AND worker = ?",
+                            (time.time() + self.lease_time, unit_id, worker))
+
+    def has_listing(self, listing_id):
+        return self.db.execute("SELECT 1 FROM listings WHERE listing_id = ?", (listing_id,)).fetchone() is not None
+
+    def attribute(self, listing_id, keyword, requested_location):
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO attributions VALUES (?, ?, ?)",
+                            (listing_id, keyword, requested_location))
+
+    def complete(self, unit_id):
+        with self.db:
+            self.db.execute("UPDATE units SET status = 'done', error = NULL WHERE id = ?", (unit_id,))
+
+    def fail(self, unit_id, error):
+        # back into the queue, unless it's out of attempts
+        with self.db:
+            self.db.execute("UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                            "error = ? WHERE id = ?", (self.max_attempts, error, unit_id))
+
+    def counts(self):
+        # the amount of units in each status: pending, leased, done, failed
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM units GROUP BY status").fetchall())
+
+    def unfinished(self):
+        counts = self.counts()
+        return counts.get("pending", 0) + counts.get("leased", 0)
+
+    def listings(self):
+        listings = []
+        for (text,) in self.db.execute("SELECT listing FROM listings ORDER BY rowid"):
+            listing = json.loads(text)
+            if "salary" in listing:
+                listing["salary"] = tuple(listing["salary"])
+            listings.append(listing)
+        by_id = {listing["listing_id"]: listing for listing in listings}
+        for listing_id, keyword, location in self.db.execute("SELECT * FROM attributions ORDER BY rowid"):
+            if listing_id in by_id:
+                ListingRegistry.attribute(by_id[listing_id], keyword, location)
+        return listings
+
+    def close(self):
+        self.db.close()
+
+
+class WorkQueueRegistry(ListingRegistry):
+    # the ListingRegistry of one of a WorkQueue's units: listings that any unit already stored in the queue count as
+    # seen too (so their details aren't scraped again), and attributions are recorded in the queue
+    def __init__(self, queue):
+        super().__init__(listener=queue.attribute)
+        self.queue = queue
+
+    def claim(self, listing, keyword, location):
+        return super().claim(listing, keyword, location) and not self.queue.has_listing(listing["listing_id"])
+
+
+class ExchangeRates:
+    """
+    Exchange rates to USD, for normalizing salaries. They're fetched (for every currency at once) at most once every
+    ttl seconds, and kept in a snapshot file, so parsing a salary doesn't wait on the network halfway through a sweep,
+    and works offline once there's a snapshot. If fetching fails, a stale snapshot is used instead, and fetching isn't
+    tried again for retry_after seconds.
+    Rates are only fetched once a salary in another currency turns up; a sweep of USD salaries never fetches them.
+    Pass rates (USD per unit of each currency, e.g. {"CHF": 1.1}) to use a fixed table instead.
+    """
+    symbols = {"$": "USD"}
+
+    def __init__(self, path=None, ttl=24 * 60 * 60, rates=None, timeout=10, retry_after=60 * 60):
+        self._path = path  # resolved on first use, so that creating the global instance doesn't touch the disk
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.fixed = rates is not None
+        self.rates = dict(rates or {}, USD=1)
+        self.fetched = None
+        self.failed = None  # (when, error) of the last failed fetch
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = default_data_path("exchange-rates.json")
+        return self._path
+
+    def read_snapshot(self):
+        # uses the snapshot file's rates, if there is one, without going to the network; returns whether they're fresh
+        with self.lock:
+            if self.fixed:
+                return True
+            snapshot = self._read_snapshot()
+            if snapshot and (not self.fetched or snapshot["fetched"] > self.fetched):
+                self._use(snapshot)
+            return self.fresh()
+
+    def fresh(self):
+        # whether the rates we have are at most ttl seconds old (checked every time, since they go stale mid-sweep)
+        return self.fixed or (self.fetched is not None and self.fetched + self.ttl > time.time())
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def _use(self, snapshot):
+        self.rates = dict(snapshot["rates"], USD=1)
+        self.fetched = snapshot["fetched"]
+
+    def load(self):
+        # makes sure we have rates that are at most ttl seconds old, if at all possible
+        with self.lock:
+            if self.fresh():
+                return
+            if self.fetched is not None and self.failed and self.failed[0] + self.retry_after > time.time():
+                return  # stale, but the best we'll have until retry_after is up
+            snapshot = self._read_snapshot()
+            if not snapshot or snapshot["fetched"] + self.ttl <= time.time():
+                if self.failed and self.failed[0] + self.retry_after > time.time():
+                    error = self.failed[1]  # don't go to the network again just yet
+                else:
+                    try:
+                        snapshot = self.refresh()
+                        error = None
+                    except Exception as e:  # forex_python's RatesNotAvailableError, or a network error
+                        self.failed = (time.time(), e)
+                        error = e
+                if error is not None:
+                    if not snapshot:
+                        raise error
+                    if self.fetched != snapshot["fetched"]:
+                        print("Couldn't refresh exchange rates (%s), using ones from %s" % (
+                            error, datetime.datetime.fromtimestamp(snapshot["fetched"])))
+                    self._use(snapshot)
+                    return
+            self._use(snapshot)
+
+    def refresh(self):
+        # forex_python's own get_rates() has no timeout, so this makes its request itself, and has it decode that
+        import requests
+        from forex_python import converter
+        source = converter.CurrencyRates()
+        response = requests.get(source._source_url() + "latest", params={"base": "USD", "rtype": "fpy"},
+                                timeout=self.timeout)
+        if response.status_code != 200:
+            raise converter.RatesNotAvailableError("Currency Rates Source Not Ready")
+        snapshot = {"fetched": time.time(),
+                    "rates": {currency: 1 / rate for currency, rate in source._decode_rates(response).items()}}
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with NamedTemporaryFile(mode='w', dir=directory, delete=False) as f:
+            json.dump(snapshot, f)
+        os.replace(f.name, self.path)
+        return snapshot
+
+    def to_usd(self, amounts):
+        # converts a batch of (amount, currency) pairs; currencies are codes, or symbols like $
+        currencies = [self.symbols.get(currency, currency) for _, currency in amounts]
+        if not self.fresh() and any(currency != "USD" for currency in currencies):
+            self.load()
+        return [amount * self.rates[currency] if currency != "USD" else amount
+                for (amount, _), currency in zip(amounts, currencies)]
+
+
 throttler = Throttler()  # this is global, because multiple different searches need to all obey the same rate limit
 
 
@@ -138,9 +1823,111 @@ class TransientScrapeError(ScrapeError):
     pass
 
 
+class ReplayMissError(TerminalScrapeError):
+    # a request a ReplayTransport has no recorded response for; it ends the sweep, but it's not glassdoor's doing
+    pass
+
+
+class Extractors(threading.local):
+    """
+    Every xpath and regex the scrapers use, compiled once and shared by all searches, instead of being recompiled
+    for every job on every page.
+    The regexes are shared by all threads; the compiled xpaths get built once per thread, since lxml doesn't let you
+    share them between threads. Neither get built (nor lxml and regex imported) until an extractor is first used.
+    """
+    per_multipliers = {"hour": 8*(365.25*5/7)}
+    currencies = ["$", "CHF"]
+    multipliers = {"m": 1000000, "k": 1000, "": 1}
+    # the texts that mark a page as an error page (or an empty or missing one), by name
+    page_marker_texts = [
+        ("potential_bot", 'isPotentialBot":true'),
+        ("suspicious_activity", "We have been receiving some suspicious activity from you or someone sharing your "
+                                "internet network."),
+        ("gateway_timeout", "The web server reported a gateway time-out error."),
+        ("bad_gateway", "The web server reported a bad gateway error."),
+        ("no_matches", "Your filtered search does not match any jobs. Try to broaden your search by changing the "
+                       "filters above."),
+        ("volume_timeout", "your search timed out due to high volumes"),
+        ("not_found", "Sorry, we can't find that page"),
+    ]
+    regexes = None  # name -> compiled regex, once compile_regexes() has run
+    regexes_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # only called for attributes this thread doesn't have yet; the first time, that's every extractor
+        if "jobs" in self.__dict__:
+            raise AttributeError(name)
+        self.build()
+        return getattr(self, name)
+
+    @classmethod
+    def compile_regexes(cls):
+        import regex
+        return {
+            "per_hour": regex.compile(r'per (hour)'),
+            "salary_definition": regex.compile(r'(%s)([0-9]+)(%s)' % (
+                "|".join(map(regex.escape, cls.currencies)), "|".join(map(regex.escape, cls.multipliers.keys()))),
+                flags=regex.IGNORECASE),
+            "location_state": regex.compile(r",\s?(.*)\s?"),
+            "location_separator": regex.compile(r"\s*,\s*"),
+            "listing_id": regex.compile(r'jobListingId=([^&]+)'),
+            "details_url": regex.compile(r'partner/jobListing.htm\?'),
+            "office_photos": regex.compile(r'Office-Photos-'),
+            "photos": regex.compile(r'Photos'),
+            "promised_jobs_count": regex.compile(r'([0-9,]+)'),
+            "promised_jobs_title": regex.compile("We found ([0-9]+)"),
+            "gd_token": regex.compile(r'gdToken":"([^"]+)"'),
+            "filter_options_escape": regex.compile(r'\\(.)'),
+            "filter_options": {option: regex.compile(r'%s.*?\\"options\\":({.*?})' % option)
+                               for option in ["INDUSTRY", "SALRANGE"]},
+            "page_markers": regex.compile("|".join("(?P<%s>%s)" % (name, regex.escape(marker))
+                                                   for name, marker in cls.page_marker_texts)),
+        }
+
+    def build(self):
+        with self.regexes_lock:
+            if Extractors.regexes is None:
+                Extractors.regexes = self.compile_regexes()
+        self.__dict__.update(self.regexes)
+        from lxml import etree
+        X = etree.XPath
+        # search result fields: name -> (xpaths to try in order, until one of them finds something; type)
+        self.listing_fields = {
+            "title": ([X('.//a/text()')], str),
+            "company": ([
+                X('.//div[@class="flexbox empLoc"]/div/text()'),
+                # glassdoor seems to be trialling a new format for some percentage of its user base
+                X('.//div[contains(@class, "jobEmpolyerName")]/text()'),
+            ], str),
+            "location": ([X('.//span[@class="subtle loc"]/text()')], str),
+            "url": ([X('.//a/@href')], str),
+            "rating": ([X('.//span[@class="compactStars "]/text()')], float),
+            "salary": ([X('.//span[@class="green small"]/text()')], str),
+        }
+        self.jobs = X('//li[@class="jl"]')
+        self.next_page = X('//li[@class="next"]//a/@href')
+        self.jobs_count = X('//*[@class="jobsCount"]/text()')
+        self.jobs_title = X('//h1[@id="jobTitle"]/text()')
+        self.scripts = X("//script")
+        self.description = X('//div[contains(@class, "jobDescriptionContent")]')
+        self.text = X(".//text()")
+        self.photo_links = X('//*[contains(@href, "Photos")]/@href')
+        self.salary_rows = X('//div[contains(@class, "salaryList")]//div[contains(@class, "SalaryRowStyle__row")]')
+        self.salary_title = X('.//div[contains(@class,"JobInfoStyle__jobTitle")]/a/text()')
+        self.salary_title_unlinked = X('.//div[contains(@class,"JobInfoStyle__jobTitle")]/span/text()')
+        self.salary_count = X('.//div[contains(@class,"JobInfoStyle__jobCount")]/text()')
+        self.salary_values = X('.//div[contains(@class,"RangeBarStyle__values")]/span/text()')
+
+
+extractors = Extractors()
+exchange_rates = ExchangeRates()  # also global; replace it with ExchangeRates(rates=...) to work fully offline
+
+
 class BaseSearch:
     def __init__(self, minimum_salary, minimum_rating, industry_code,
-                 minimum_employer_size, paranoid, throttler_, progress_tracker):
+                 minimum_employer_size, paranoid, throttler_, progress_tracker, executor=None, cache=None,
+                 listing_index=None, checkpoint=None, transport=None, partition_counts=None, salary_index=None,
+                 metrics=None, location_index=None, listing_registry=None, description_store=None):
         self.minimum_salary = minimum_salary
         self.minimum_rating = minimum_rating
         self.industry_code = industry_code
@@ -148,58 +1935,114 @@ class BaseSearch:
         self.paranoid = paranoid
         self.throttler = throttler_
         self.progress = progress_tracker
-        self.session = requests.Session()
-        self.session.headers = {
-            'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
-            'accept-encoding': 'gzip, deflate, br',
-            'accept-language': 'en-GB,en;q=0.9,en-US;q=0.8',
-            'cache-control': 'no-cache',
-            'connection': 'keep-alive',
-            'host': 'www.glassdoor.com',
-            'upgrade-insecure-requests': '1',
-            'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/41.0.2227.1 Safari/537.36',
-        }
+        # a thread pool shared by every sub-search of a sweep; if None, everything is fetched serially
+        self.executor = executor
+        self.cache = cache  # a ResponseCache, or None
+        self.listing_index = listing_index  # a ListingIndex, or None; if set, only new/stale listings get scraped
+        self.checkpoint = checkpoint  # a Checkpoint, or None
+        self.transport = transport or HTTPTransport()
+        self.partition_counts = partition_counts  # a PartitionCounts, or None
+        self.salary_index = salary_index  # a SalaryIndex, or None
+        self.metrics = metrics or Metrics()
+        # resolves location strings (and which salary filters they support) at most once per sweep, or across sweeps
+        self.location_index = location_index or LocationIndex(":memory:")
+        # a ListingRegistry, or None; if set, listings it has already seen are skipped rather than scraped again
+        self.listing_registry = listing_registry
+        # a DescriptionStore, or None; if set, listings get a description_hash instead of their description
+        self.description_store = description_store
+
+    def single_search(self, keyword, location, industry_code, minimum_employer_size=None):
+        # a sub-search that shares this search's filters, throttle, progress, worker pool and transport
+        if minimum_employer_size is None:
+            minimum_employer_size = self.minimum_employer_size
+        return SingleSearch(keyword, location, self.minimum_salary, self.minimum_rating, industry_code,
+                            minimum_employer_size, self.paranoid, self.throttler, self.progress, self.executor,
+                            self.cache, self.listing_index, self.checkpoint, self.transport, self.partition_counts,
+                            self.salary_index, self.metrics, self.location_index, self.listing_registry,
+                            self.description_store)
 
     def get_home_page(self):
         # retrieve the home page to simulate ourselves being a "real user"
         response = self.get("https://www.glassdoor.com/")
-        self.session.headers['Referer'] = response.url
-
-    def post(self, *args, **kwargs):
-        return self.requests_op(self.session.post, *args, **kwargs)
-
-    def get(self, *args, **kwargs):
-        return self.requests_op(self.session.get, *args, **kwargs)
+        self.transport.headers['Referer'] = response.url
+
+    # kind is what sort of page we're requesting ("details", "salary", "location", ...), for the cache's benefit
+    # cache_url, if given, is what the response gets cached under instead of url, for urls with parameters (like
+    # tracking ones) that don't change the page
+    def post(self, url, kind=None, cache_url=None, **kwargs):
+        return self.cached_op("POST", self.transport.post, url, kind, cache_url, **kwargs)
+
+    def get(self, url, kind=None, cache_url=None, **kwargs):
+        return self.cached_op("GET", self.transport.get, url, kind, cache_url, **kwargs)
+
+    def cached_op(self, method, op, url, kind, cache_url=None, **kwargs):
+        metrics_kind = kind or "search"
+        if not (self.cache and self.cache.caches(kind)):
+            return self.requests_op(op, url, metrics_kind=metrics_kind, **kwargs)
+        key = self.cache.key(method, cache_url or url, kwargs.get("params"), kwargs.get("data"))
+        response = self.cache.lookup(kind, key)
+        if response is None:
+            response = self.requests_op(op, url, metrics_kind=metrics_kind, **kwargs)
+            self.cache.store(kind, key, response)
+            return response
+        self.metrics.count("cache_hits_total", metrics_kind)
+        return ParsedResponse(response, self.metrics, metrics_kind)
 
     # wrapper around requests operations, to make sure we obey the throttle
-    def requests_op(self, op, *args, **kwargs):
+    # returns a ParsedResponse
+    def requests_op(self, op, *args, metrics_kind="search", **kwargs):
+        import requests
         retries = 0
         while True:
+            sent = []
+
+            def send():
+                sent.append(time.perf_counter())
+                return op(*args, **kwargs)
+            start = time.perf_counter()
             try:
-                response = self.throttler.throttle(lambda: op(*args, **kwargs))
+                raw_response = self.throttler.throttle(send)
+                self.record_request(metrics_kind, start, sent[0], raw_response)
+                response = ParsedResponse(raw_response, self.metrics, metrics_kind)
                 self.check_page_for_errors(response)
-                return response
+            except TerminalScrapeError as e:
+                self.metrics.count("errors_total", metrics_kind)
+                if not isinstance(e, ReplayMissError):  # which isn't a sign of being flagged as a bot
+                    self.throttler.failure(e)
+                raise
             except (TransientScrapeError, requests.RequestException) as e:
                 print(e)
-                sleep(1*2**retries)
+                self.metrics.count("errors_total", metrics_kind)
+                self.throttler.failure(e)
+                self.throttler.backoff(retries)
                 retries += 1
                 if retries > 12:  # up to 4096, ~68 minutes
                     print("Out of retries, failing")
                     raise
+                self.metrics.count("retries_total", metrics_kind)
                 continue
+            self.throttler.success()
+            return response
+
+    def record_request(self, kind, start, sent, response):
+        received = time.perf_counter()
+        self.metrics.count("requests_total", kind)
+        self.metrics.observe("throttle_wait_seconds", kind, sent - start)
+        self.metrics.observe("request_seconds", kind, received - sent)
+        content = getattr(response, "content", None)
+        self.metrics.observe("response_bytes", kind, len(content) if content is not None else len(response.text))
 
     @classmethod
     def check_page_for_errors(cls, response):
-        # checks if the page is an error page, parses the error message, and re-raises Terminal or Transient
-        is_potential_bot_match = regex.search(r'isPotentialBot":(true|false)', response.text)
-        is_potential_bot = is_potential_bot_match and is_potential_bot_match.groups()[0] == "true"
-        suspicious_activity = bool(regex.search(r'We have been receiving some suspicious activity from you or '
-                                                r'someone sharing your internet network.', response.text))
-        gateway_timeout = regex.search(r'The web server reported a gateway time-out error.', response.text)
-        bad_gateway = regex.search(r'The web server reported a bad gateway error.', response.text)
-        no_matches = regex.search(r'Your filtered search does not match any jobs. Try to broaden your search by changing the filters above.', response.text)
-        volume_timeout = regex.search(r'your search timed out due to high volumes', response.text)
-        promised_jobs = cls.parse_promised_jobs(html.fromstring(response.text))  # TODO filthy
+        # checks if the page (a ParsedResponse) is an error page, parses the error message,
+        # and re-raises Terminal or Transient
+        markers = response.markers
+        is_potential_bot = "potential_bot" in markers
+        suspicious_activity = "suspicious_activity" in markers
+        gateway_timeout = "gateway_timeout" in markers
+        bad_gateway = "bad_gateway" in markers
+        no_matches = "no_matches" in markers
+        volume_timeout = "volume_timeout" in markers
         if is_potential_bot or suspicious_activity:
             raise TerminalScrapeError("Glassdoor suspects us of being a bot while getting %s (is_potential_bot: %s, 'suspicious activity': %s)!" % (response.url, is_potential_bot, suspicious_activity))
         elif gateway_timeout:
@@ -210,124 +2053,369 @@ class BaseSearch:
             # I'm not actually sure if this means our request volume, or general request volume across the site
             # regardless, a retry usually makes this go away
             raise TransientScrapeError("Volume timeout")
-        elif no_matches and promised_jobs:
+        elif no_matches and cls.parse_promised_jobs(response.tree):
             raise TransientScrapeError("No jobs when there should be")
         else:
             return True
 
+    @staticmethod
+    def parse_promised_jobs(parser):
+        # parse the total amount of jobs glassdoor claims our search to contain
+        # for some reason this amount is given in two different formats sometimes
+        try:
+            j1 = extractors.jobs_count(parser)
+            j2 = extractors.promised_jobs_count.search(j1[0]).groups()[0]
+            j3 = j2.replace(',', '')
+            return int(j3)
+        except IndexError:
+            try:
+                j1 = extractors.jobs_title(parser)[0]
+                return int(extractors.promised_jobs_title.search(j1).groups()[0])
+            except IndexError:
+                return None
+
 
 class Search(BaseSearch):
-    # this class encapsulates the query parameters, requests session, and search progress tracking
+    # this class encapsulates the query parameters, transport, and search progress tracking
     def __init__(self, keywords, locations, minimum_salary=None, minimum_rating=None, industry_code=-1,
-                 minimum_employer_size=ES_ANY, paranoid=False, throttler_=None, progress_tracker=None):
+                 minimum_employer_size=ES_ANY, paranoid=False, throttler_=None, progress_tracker=None, workers=1,
+                 cache=None, listing_index=None, transport=None, partition_counts=None, salary_index=None,
+                 metrics=None, location_index=None, description_store=None):
         self.keywords = [keywords] if isinstance(keywords, str) else keywords
         self.locations = [locations] if isinstance(locations, str) else locations
+        # with more than one worker, details/salary pages and the next search page are fetched concurrently
+        # all workers still draw from the same throttler, so this only helps when the throttle rate is faster
+        # than a single request's round-trip
+        self.workers = workers
         super().__init__(minimum_salary, minimum_rating, industry_code, minimum_employer_size, paranoid,
-                         throttler_ or throttler, progress_tracker or ProgressTracker())
-
-    def run(self):
+                         throttler_ or throttler, progress_tracker or ProgressTracker(), cache=cache,
+                         listing_index=listing_index, transport=transport, partition_counts=partition_counts,
+                         salary_index=salary_index, metrics=metrics, location_index=location_index,
+                         description_store=description_store)
+
+    def run(self, resume=None, compact=False):
+        # resume is the path of a checkpoint file; it's created if it doesn't exist yet, and continued from if it does
+        # with compact, returns a ListingSet rather than a list of dicts, which takes several times less memory
+        listings = ListingSet() if compact else []
+        if resume is None:
+            listings.extend(self.iter_listings())
+            return listings
+        checkpoint = Checkpoint(resume)
+        try:
+            listings.extend(checkpoint.listings)
+            listings.extend(self.iter_listings(checkpoint))
+            return listings
+        finally:
+            checkpoint.close()
+
+    def export(self, sink, resume=None):
+        # streams the sweep's listings (and their attributions) into a Sink as they're scraped, and closes it; returns
+        # how many listings were written
+        # when resuming, only listings that weren't emitted by the previous run are written
+        checkpoint = Checkpoint(resume) if isinstance(resume, str) else resume
+        written = 0
+        try:
+            with sink:
+                if checkpoint:
+                    checkpoint.sink = sink
+                for listing in self.iter_listings(checkpoint, sink.write_attribution):
+                    sink.write(listing)
+                    written += 1
+        finally:
+            if checkpoint:
+                checkpoint.sink = None
+                if checkpoint is not resume:
+                    checkpoint.close()
+        return written
+
+    def iter_listings(self, resume=None, attributions=None):
+        # yields each listing as soon as it's scraped; listings already seen under another location/keyword (or earlier
+        # in the same search) aren't scraped again, just attributed to it in their keywords and requested_locations
+        # attributions, if given, is called with each new (listing_id, keyword, requested_location), including ones for
+        # listings that were yielded before
+        # with resume (a Checkpoint or a path to one), only yields listings that weren't emitted by a previous run
+        if self.workers > 1 and self.executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                self.executor = executor
+                try:
+                    yield from self.iter_listings(resume, attributions)
+                finally:
+                    self.executor = None
+            return
+        if isinstance(resume, str):
+            checkpoint = Checkpoint(resume)
+            try:
+                yield from self.iter_listings(checkpoint, attributions)
+            finally:
+                checkpoint.close()
+            return
+        self.checkpoint = resume
+
+        def attribute(listing_id, keyword, location):
+            if resume:
+                resume.attribute(listing_id, keyword, location)
+            if attributions:
+                attributions(listing_id, keyword, location)
+        # listings (and attributions) emitted by a previous run count as seen, too
+        self.listing_registry = ListingRegistry(resume.listings if resume else (),
+                                                resume.attributions if resume else (), attribute)
+        try:
+            yield from self._iter_listings()
+        finally:
+            self.checkpoint = None
+            self.listing_registry = None
+
+    def _iter_listings(self):
+        cursor = None
+        if self.checkpoint:
+            if self.checkpoint.done:
+                return
+            cursor = self.checkpoint.cursor
+            if cursor and (cursor["location"] not in self.locations or cursor["keyword"] not in self.keywords):
+                raise ValueError("Checkpoint %s is for a different search" % self.checkpoint.path)
+        # a snapshot's rates, if there are any; they only get fetched once (and if) a salary needs converting
+        exchange_rates.read_snapshot()
         if self.paranoid:
             self.get_home_page()
-        results = dict()
         self.progress.set_total("location", len(self.locations))
         for location in self.locations:
             self.progress.increment("location")
             self.progress.set_total("keyword", len(self.keywords))
             for keyword in self.keywords:
                 self.progress.increment("keyword")
-                # assume single industry; if we fork into multiple industries, that code will overwrite this
-                self.progress.set_total("industry", 1)
-                self.progress.set_current("industry", 1)
-                for listing in SingleSearch(keyword, location, self.minimum_salary, self.minimum_rating,
-                                            self.industry_code, self.minimum_employer_size, self.paranoid,
-                                            self.throttler, self.progress).run():
-                    results[listing['listing_id']] = listing
-        return list(results.values())
+                resume = None
+                if cursor:
+                    if (location, keyword) != (cursor["location"], cursor["keyword"]):
+                        continue  # finished by a previous run
+                    resume, cursor = cursor, None
+                # assume a single partition; if we split the search up, that code will overwrite this
+                for dimension in SingleSearch.partition_dimensions:
+                    self.progress.set_total(dimension, 1)
+                    self.progress.set_current(dimension, 1)
+                for listing in self.single_search(keyword, location, self.industry_code).iter_listings(resume):
+                    if self.checkpoint:
+                        self.checkpoint.emit(listing)
+                    yield listing
+        if self.checkpoint:
+            self.checkpoint.save({"done": True}, self.progress.snapshot())
+        self.progress.finish()
 
 
 class SingleSearch(BaseSearch):
     def __init__(self, keyword, location, minimum_salary, minimum_rating, industry_code,
-                 minimum_employer_size, paranoid, throttler_, progress_tracker):
+                 minimum_employer_size, paranoid, throttler_, progress_tracker, executor=None, cache=None,
+                 listing_index=None, checkpoint=None, transport=None, partition_counts=None, salary_index=None,
+                 metrics=None, location_index=None, listing_registry=None, description_store=None):
         self.keyword = keyword
         self.location_string = location
         self.location_compound_id = None
         super().__init__(minimum_salary, minimum_rating, industry_code, minimum_employer_size, paranoid,
-                         throttler_, progress_tracker)
+                         throttler_, progress_tracker, executor, cache, listing_index, checkpoint, transport,
+                         partition_counts, salary_index, metrics, location_index, listing_registry,
+                         description_store)
+
+    # Glassdoor caps searches to 30 pages, which is around 900 jobs (most pages contain 30 jobs)
+    # We use a workaround: we split a search that's over the cap into multiple searches, one per option of a filter
+    # Each filter's options are mutually exclusive, so this partitions the search space without duplicates, and a
+    # sub-search that is still over the cap gets split up further by the next filter
+    # (the employer size options don't cover employers of unknown size, so splitting by them can miss a few jobs)
+    # Rating and salary can't be used for this: glassdoor only lets you filter them by a minimum, not a range
+    partition_cap = 900
+    partition_dimensions = ["industry", "employer size"]
+    employer_sizes = [ES_0_200, ES_201_500, ES_501_1000, ES_1001_5000, ES_5001_PLUS]
+    # if set (to a WorkQueue), this search queues the sub-searches it splits into instead of running them itself
+    work_queue = None
 
     def run(self):
+        # a mid-pagination re-query yields some listings twice; keep the latest copy of each
+        return list({listing['listing_id']: listing for listing in self.iter_listings()}.values())
+
+    def iter_listings(self, resume=None):
+        # resume is a checkpoint cursor within this search (same location and keyword) to continue from
+        progress_at_start = self.progress.snapshot()
+        resuming = resume and self.is_partition(resume)
+        known = self.partition_counts.get(self.partition_key()) if self.partition_counts else None
+        if known and known[0] > self.partition_cap and known[1] and not resuming:
+            # this partition was too big last time too; split it up without querying it first
+            yield from self.iter_partitions(known[1], resume)
+            return
         data = self.figure_out_query_params()
-        result = []
         page_number = 1
         current_url = "https://www.glassdoor.com/Job/jobs.htm"
-        response = self.post(current_url, data=data)
-
-        self.session.headers['Referer'] = response.url
-        parser = html.fromstring(response.text)
+        if resuming:
+            if not resume["page_url"]:
+                return  # this search was already finished
+            # pick up at the page we stopped at, with the progress as it was then
+            current_url = resume["page_url"]
+            response = self.get(current_url)
+            if self.not_found(response):
+                # we stopped right before running into the 30 page truncation
+                self.save_checkpoint(None)
+                return
+            self.progress.restore(self.checkpoint.progress)
+        else:
+            response = self.post(current_url, data=data)
+
+        self.transport.headers['Referer'] = response.url
+        parser = response.tree
+        if "no_matches" in response.markers and not resuming:
+            # an empty partition (e.g. an employer size nobody in this industry has)
+            if self.partition_counts:
+                self.partition_counts.record(self.partition_key(), 0)
+            return
         promised_jobs = self.parse_promised_jobs(parser)
         if not promised_jobs:
             self.fail_dumping_response("Got an unknown page with no promised jobs", response)
-        if promised_jobs > 900 and self.industry_code == -1:
-            # Glassdoor caps searches to 30 pages, which is around 900 jobs (most pages contain 30 jobs)
-            # We use a workaround: we split up the search into multiple searches, one per industry code
-            # We know every industry code, and they are all mutually exclusive, so this is guaranteed to partition the
-            # search space without omissions or duplicates
-            # That said, the new searches aren't guaranteed to be below 900 themselves
-            overall_result = []
-            industries = list(filter(lambda t: t[0] != '-1', self.parse_industry_options(parser).items()))
-            self.progress.set_total("industry", len(industries))
-            self.progress.set_current("industry", 0)
-            for index, (industry_code, industry_name) in enumerate(industries):
-                self.progress.increment("industry")
-                overall_result += SingleSearch(self.keyword, self.location_string, self.minimum_salary,
-                                               self.minimum_rating, industry_code, self.minimum_employer_size,
-                                               self.paranoid, self.throttler, self.progress).run()
-            return overall_result
+        if promised_jobs > self.partition_cap and not resuming:
+            dimension = self.split_dimension()
+            if dimension:
+                children = self.partition_options(dimension, parser)
+                if self.partition_counts:
+                    self.partition_counts.record(self.partition_key(), promised_jobs, children)
+                yield from self.iter_partitions(children, resume)
+                return
+            print("Warning: %s jobs promised even with every filter split up; glassdoor will truncate them"
+                  % promised_jobs)
+        if not resuming:  # (a resumed search's expected jobs are in the restored progress already)
+            # glassdoor truncates searches to the cap, so we can't expect more than that
+            self.progress.expect(min(promised_jobs, self.partition_cap))
+            if self.partition_counts:
+                self.partition_counts.record(self.partition_key(), promised_jobs)
         self.progress.register_name("page")
         while True:
             self.progress.increment("page")
-            parser = html.fromstring(response.text)
+            parser = response.tree
             base_url = "https://www.glassdoor.com"
             parser.make_links_absolute(base_url)
             new_promised_jobs = self.parse_promised_jobs(parser)
             if not new_promised_jobs:
                 self.fail_dumping_response("Got an unknown page with no promised jobs", response)
 
-            this_page_listings = self.listings_from_page(parser, response.url)
-            result += this_page_listings
             if new_promised_jobs != promised_jobs:
                 if abs(new_promised_jobs - promised_jobs) > 10:
                     # I have no idea why this happens, but sometimes the query messes up mid-pagination and
                     # wildly changes your result set; a re-query fixes it
+                    # listings from earlier pages have already been yielded; with a listing registry, the re-query
+                    # skips them rather than scraping them again
                     print("Large promised jobs jump, retrying the query")
-                    # TODO this messes up the progress, but we don't know how much to rewind it by
-                    # maybe add a checkpointing function? christ it's getting complex for some goddamn progress tracking
+                    # rewind the progress to where it was when we started this search
                     # TODO maybe add RetryJob, RetryPage, RetryIndustry exceptions?
-                    return SingleSearch(self.keyword, self.location_string, self.minimum_salary, self.minimum_rating,
-                                        self.industry_code, self.minimum_employer_size, self.paranoid, self.throttler,
-                                        self.progress).run()
+                    self.progress.restore(progress_at_start)
+                    yield from self.single_search(self.keyword, self.location_string, self.industry_code,
+                                                  self.minimum_employer_size).iter_listings()
+                    return
                 promised_jobs = new_promised_jobs
-            if not this_page_listings:
+
+            next_page = extractors.next_page(parser)
+            # when pipelining, the next page is fetched while we're still busy with this page's details pages
+            next_response = self.executor.submit(self.get, next_page[0]) if next_page and self.executor else None
+
+            # (checked up front, since a page of listings this sweep has already seen yields nothing)
+            if not extractors.jobs(parser):
                 self.fail_dumping_response("Got an unknown page with no listings", response)
+            yield from self.listings_from_page(response)
 
-            next_page = parser.xpath('//li[@class="next"]//a/@href')
             if not next_page:
+                self.save_checkpoint(None)
                 break
+            self.save_checkpoint(next_page[0])
             current_url = next_page[0]
-            response = self.get(current_url)
-            self.session.headers['Referer'] = response.url
+            response = next_response.result() if next_response else self.get(current_url)
+            self.transport.headers['Referer'] = response.url
             if self.not_found(response):
                 # artificial 30 page limit has hit us
                 print("Glassdoor artificial 30 page truncation!")
+                self.save_checkpoint(None)
                 break
             page_number += 1
-        return result
+
+    def split_dimension(self):
+        # the next filter to split this search up by, or None if every filter is already narrowed down
+        if str(self.industry_code) == "-1":
+            return "industry"
+        if self.minimum_employer_size == ES_ANY:
+            return "employer size"
+        return None
+
+    def partition_options(self, dimension, parser):
+        if dimension == "industry":
+            return [code for code in self.parse_industry_options(parser).keys() if code != '-1']
+        return list(self.employer_sizes)
+
+    def sub_partition(self, option):
+        # the search for one option of this search's split dimension
+        if self.split_dimension() == "industry":
+            return self.single_search(self.keyword, self.location_string, option)
+        return self.single_search(self.keyword, self.location_string, self.industry_code, option)
+
+    def iter_partitions(self, children, resume=None):
+        # scrapes the sub-searches of each option of this search's split dimension in turn
+        dimension = self.split_dimension()
+        if self.work_queue is not None:
+            for option in children:
+                search = self.sub_partition(option)
+                if not search.known_empty():
+                    self.work_queue.put(search.location_string, search.keyword, search.industry_code,
+                                        search.minimum_employer_size)
+            return
+        self.progress.set_total(dimension, len(children))
+        self.progress.set_current(dimension, 0)
+        below = self.partition_dimensions[self.partition_dimensions.index(dimension) + 1:]
+        for option in children:
+            self.progress.increment(dimension)
+            for name in below:  # a previous option may have been split up further; this one might not be
+                self.progress.set_total(name, 1)
+                self.progress.set_current(name, 1)
+            search = self.sub_partition(option)
+            if resume:
+                if not search.contains_partition(resume):
+                    continue  # finished by a previous run
+                yield from search.iter_listings(resume)
+                resume = None
+                continue
+            if search.known_empty():
+                continue  # this was empty last time
+            yield from search.iter_listings()
+
+    def known_empty(self):
+        known = self.partition_counts.get(self.partition_key()) if self.partition_counts else None
+        return bool(known) and known[0] == 0
+
+    def partition_key(self):
+        return json.dumps([self.keyword, self.location_string, self.minimum_salary, self.minimum_rating,
+                           str(self.industry_code), str(self.minimum_employer_size)])
+
+    def is_partition(self, cursor):
+        return (cursor["industry_code"] == str(self.industry_code)
+                and cursor.get("employer_size", str(ES_ANY)) == str(self.minimum_employer_size))
+
+    def contains_partition(self, cursor):
+        # whether the cursor's partition is this one, or one of its sub-partitions
+        return ((str(self.industry_code) == "-1" or cursor["industry_code"] == str(self.industry_code))
+                and (self.minimum_employer_size == ES_ANY
+                     or cursor.get("employer_size", str(ES_ANY)) == str(self.minimum_employer_size)))
+
+    def save_checkpoint(self, next_page_url):
+        # called once every listing of the current page has been emitted; a next_page_url of None means we're done
+        if self.checkpoint:
+            self.checkpoint.save({
+                "location": self.location_string,
+                "keyword": self.keyword,
+                "industry_code": str(self.industry_code),
+                "employer_size": str(self.minimum_employer_size),
+                "page_url": next_page_url,
+            }, self.progress.snapshot())
 
     def figure_out_query_params(self):
         # retrieve the location code from the location string
-        location_params = {"term": self.location_string, "maxLocationsToReturn": 1}
-        location_response = self.post("https://www.glassdoor.com/findPopularLocationAjax.htm?",
-                                      data=location_params).json()[0]
-        self.location_compound_id = (location_response['locationType'], int(location_response['locationId']))
+        self.location_compound_id = self.location_index.lookup(self.location_string)
+        if self.location_compound_id is None:
+            location_params = {"term": self.location_string, "maxLocationsToReturn": 1}
+            location_response = self.post("https://www.glassdoor.com/findPopularLocationAjax.htm?",
+                                          kind="location", data=location_params).json()[0]
+            self.location_compound_id = (location_response['locationType'], int(location_response['locationId']))
+            self.location_index.record(self.location_string, self.location_compound_id)
         data = {
             "clickSource": "searchBtn",
             "jobType": "",
@@ -343,7 +2431,7 @@ class SingleSearch(BaseSearch):
             # do an initial post to "get to the options bar"; this isn't necessary,
             # but a real user wouldn't be able to send all the right kwargs without doing this post first
             response = self.post("https://www.glassdoor.com/Job/jobs.htm", data=data)
-            self.session.headers['Referer'] = response.url
+            self.transport.headers['Referer'] = response.url
 
         # now add in all the stuff you weren't supposed to be able to add initially
         data.update({
@@ -364,11 +2452,14 @@ class SingleSearch(BaseSearch):
         for k in ["typedKeyword", "suggestChosen", "suggestCount", "clickSource"]:
             data.pop(k)
         if self.minimum_salary is not None:
-            # do a post with all the non-salary options
-            # this isn't a paranoia thing; this is the only way to know whether our location supports salary filtering
-            response = self.post("https://www.glassdoor.com/Job/jobs.htm", data=data)
-            self.session.headers['Referer'] = response.url
-            salary_options = self.parse_salary_options(html.fromstring(response.text))
+            salary_options = self.location_index.salary_options(self.location_compound_id)
+            if salary_options is None:
+                # do a post with all the non-salary options
+                # this isn't a paranoia thing; it's the only way to know whether our location supports salary filtering
+                response = self.post("https://www.glassdoor.com/Job/jobs.htm", data=data)
+                self.transport.headers['Referer'] = response.url
+                salary_options = self.parse_salary_options(response.tree)
+                self.location_index.record_salary_options(self.location_compound_id, salary_options)
             # now finally add salary, if possible
             if not salary_options:
                 # salary options not available for this search (probably location based)
@@ -386,11 +2477,12 @@ class SingleSearch(BaseSearch):
 
     @staticmethod
     def not_found(response):
-        return bool(regex.search(r"Sorry, we can't find that page", response.text))
+        return "not_found" in response.markers
 
     @staticmethod
     def extract(parser, xpath, type_=str):
-        parse = parser.xpath(xpath)
+        # xpath is either a string or a compiled etree.XPath
+        parse = parser.xpath(xpath) if isinstance(xpath, str) else xpath(parser)
         if parse is None:
             return None
         items = list(map(lambda x: x.strip(" –\n\r,"), parse))
@@ -398,108 +2490,213 @@ class SingleSearch(BaseSearch):
             return None
         return type_(items[0])
 
+    @classmethod
+    def extract_field(cls, parser, field):
+        # extracts one of the search result fields in the extractors table
+        xpaths, type_ = extractors.listing_fields[field]
+        for xpath in xpaths:
+            value = cls.extract(parser, xpath, type_)
+            if value is not None:
+                return value
+        return None
+
     @staticmethod
     def parse_location(s):
-        state_parts = list(map(str.strip, regex.findall(",\s?(.*)\s?", s)))
+        state_parts = list(map(str.strip, extractors.location_state.findall(s)))
         state = state_parts[0] if state_parts else None
         city = s.replace(", %s" % state, '').strip()
         return city, state
 
     @classmethod
     def parse_salary(cls, parser):
-        salary_string = parser.xpath('.//span[@class="green small"]/text()')
+        salary_string = cls.extract_field(parser, "salary")
         if not salary_string:
             return None
-        return tuple(map(cls.parse_salary_definition, salary_string[0].strip().split("-")))
-
-    def listings_from_page(self, parser, url):
-        result = []
-        jobs = parser.xpath('//li[@class="jl"]')
+        return tuple(exchange_rates.to_usd(list(map(cls.parse_salary_amount, salary_string.split("-")))))
+
+    def listings_from_page(self, page):
+        # generator; each listing is yielded, in page order, as soon as its details page has been scraped
+        # only the details/salary requests are handed to the worker pool, the search page is parsed right here
+        parser = page.tree
+        url = page.url
+        jobs = extractors.jobs(parser)
         self.progress.set_total("job", len(jobs))
-        for job_index, job in enumerate(jobs):
-            self.progress.increment("job")
-            city, state = self.parse_location(self.extract(job, './/span[@class="subtle loc"]/text()'))
-            listing_url = self.extract(job, './/a/@href')
-            listing = {
-                "title": self.extract(job, './/a/text()'),
-                "company": self.extract(job, './/div[@class="flexbox empLoc"]/div/text()'),
-                "location": self.extract(job, './/span[@class="subtle loc"]/text()'),
-                "requested_location": self.location_string,
-                "city": city,
-                "state": state,
-                "url": listing_url,
-                "listing_id": self.parse_listing_id(listing_url),
-            }
-            if listing['company'] is None:
-                # glassdoor seems to be trialling a new format for some percentage of its user base
-                listing['company'] = self.extract(job, './/div[contains(@class, "jobEmpolyerName")]/text()')
-            details_page_parser = self.get_details_page(listing_url)
-            try:
-                salary_range = self.parse_salary(job) or self.get_salary_the_hard_way(listing["title"], details_page_parser)
-            except Exception as i:
-                e = Exception()
-                e.parser = parser
-                e.url = url
-                e.old = i
-                raise e
-            rating = self.extract(job, './/span[@class="compactStars "]/text()', float)
-            if rating is not None:
-                listing['rating'] = rating
-            if salary_range:
-                if isinstance(salary_range[0], (tuple, list)) or isinstance(salary_range[1], (tuple, list)):
-                    raise Exception(salary_range)
-                if (salary_range[0] + salary_range[1]) / 2 < 100:
-                    self.fail_dumping_text_url("Scraped an unreasonably small salary", parser.text_content(), url)
-                listing["salary"] = salary_range
-            listing["description"] = self.parse_description(details_page_parser)
-            result.append(listing)
-        return result
+        if not self.executor:
+            for job in jobs:
+                self.progress.increment("job")
+                listing, inline_salary = self.timed_parse_listing(job)
+                if self.duplicate_listing(listing):
+                    continue
+                if self.known_listing(listing, inline_salary):
+                    yield self.finish_listing(listing, (inline_salary, None), parser, url)
+                    continue
+                yield self.finish_listing(listing, self.scrape_details(listing, inline_salary, parser, url),
+                                          parser, url)
+            return
+        # fetch all the details pages of this page at once; the throttler still spaces out the actual requests
+        from concurrent.futures import Future
+        pending = []
+        for job in jobs:
+            listing, inline_salary = self.timed_parse_listing(job)
+            if self.duplicate_listing(listing):
+                self.progress.increment("job")
+                continue
+            if self.known_listing(listing, inline_salary):
+                future = Future()
+                future.set_result((inline_salary, None))
+            else:
+                future = self.executor.submit(self.scrape_details, listing, inline_salary, parser, url)
+            pending.append((listing, future))
+        try:
+            for listing, future in pending:
+                self.progress.increment("job")
+                yield self.finish_listing(listing, future.result(), parser, url)
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def timed_parse_listing(self, job):
+        start = time.perf_counter()
+        try:
+            return self.parse_listing(job)
+        finally:
+            self.metrics.count("listings_total", "search")
+            self.metrics.observe("parse_seconds", "listing", time.perf_counter() - start)
+
+    def duplicate_listing(self, listing):
+        # whether this sweep has already scraped (or is scraping) this listing, under this search or another one
+        if self.listing_registry is None or self.listing_registry.claim(listing, self.keyword, self.location_string):
+            return False
+        self.metrics.count("listings_deduplicated_total", "details")
+        return True
+
+    def known_listing(self, listing, inline_salary):
+        # whether incremental mode lets us skip this listing's details page
+        if self.listing_index is None:
+            return False
+        content_hash = self.listing_index.content_hash(listing, inline_salary)
+        if self.listing_index.is_fresh(listing["listing_id"], content_hash):
+            self.listing_index.record(listing["listing_id"], content_hash, scraped=False)
+            self.metrics.count("listings_skipped_total", "details")
+            return True
+        return False
+
+    def parse_listing(self, job):
+        # parses a single search result; returns the listing, and its salary if the search result shows one
+        location = self.extract_field(job, "location")
+        city, state = self.parse_location(location)
+        listing_url = self.extract_field(job, "url")
+        listing = {
+            "title": self.extract_field(job, "title"),
+            "company": self.extract_field(job, "company"),
+            "location": location,
+            "requested_location": self.location_string,
+            "city": city,
+            "state": state,
+            "url": listing_url,
+            "listing_id": self.parse_listing_id(listing_url),
+        }
+        rating = self.extract_field(job, "rating")
+        if rating is not None:
+            listing['rating'] = rating
+        return listing, self.parse_salary(job)
+
+    def scrape_details(self, listing, salary_range, parser, url):
+        # scrapes the listing's details page (and salary page, if need be); safe to run on a worker thread
+        # returns (salary_range, description)
+        details_page_parser = self.get_details_page(listing["url"])
+        if self.listing_index is not None:
+            self.listing_index.record(listing["listing_id"], self.listing_index.content_hash(listing, salary_range),
+                                      scraped=True)
+        try:
+            if not salary_range:
+                salary = self.get_salary_the_hard_way(listing["title"], details_page_parser)
+                if salary:
+                    salary_range, listing["salary_sample_size"] = salary
+        except Exception as i:
+            e = Exception()
+            e.parser = parser
+            e.url = url
+            e.old = i
+            raise e
+        return salary_range, self.parse_description(details_page_parser)
+
+    def finish_listing(self, listing, details, parser, url):
+        # details is (salary_range, description); description is None if we skipped a known listing's details page
+        salary_range, description = details
+        if salary_range:
+            if isinstance(salary_range[0], (tuple, list)) or isinstance(salary_range[1], (tuple, list)):
+                raise Exception(salary_range)
+            if (salary_range[0] + salary_range[1]) / 2 < 100:
+                self.fail_dumping_text_url("Scraped an unreasonably small salary", parser.text_content(), url)
+            listing["salary"] = salary_range
+        if description is None:
+            return listing
+        if self.description_store is not None:
+            listing["description_hash"] = self.description_store.put(description)
+        else:
+            listing["description"] = description
+        return listing
 
     def get_details_page(self, listing_url):
-        details_url = regex.sub(r'partner/jobListing.htm\?', 'job-listing/details.htm?', listing_url)
-        details_page_response = self.get(details_url)
-        details_page_parser = html.fromstring(details_page_response.text)
+        details_url = extractors.details_url.sub('job-listing/details.htm?', listing_url)
+        # the listing url's tracking parameters differ from search to search; the listing's id is all that matters
+        cache_url = "https://www.glassdoor.com/job-listing/details.htm?jobListingId=%s" % (
+            self.parse_listing_id(listing_url))
+        details_page_response = self.get(details_url, kind="details", cache_url=cache_url)
+        details_page_parser = details_page_response.tree
         details_page_parser.make_links_absolute(details_url)
         return details_page_parser
 
     @staticmethod
     def parse_description(details_page_parser):
-        description = details_page_parser.xpath('//div[contains(@class, "jobDescriptionContent")]')
+        description = extractors.description(details_page_parser)
         if not description:
             return ""
-        return "\n".join(etree.XPath(".//text()")(description[0]))
+        return "\n".join(extractors.text(description[0]))
 
     def get_salary_the_hard_way(self, job_title, details_page_parser):
         # look up all salaries of the company by job title and location; sometimes it's listed there
+        # returns (salary_range, sample_size), or None
         # get to the salaries link by mangling the photos link in the details page
-        photo_links = details_page_parser.xpath('//*[contains(@href, "Photos")]/@href')
+        photo_links = extractors.photo_links(details_page_parser)
         photos_link = next(filter(lambda l: "Office-Photos-IMG" not in l, photo_links))
-        salary_url = regex.sub(r'Photos', 'Salary', regex.sub(r'Office-Photos-', 'Salaries-', photos_link))
-        params = {"selectedLocationString": "%s,%s" % (self.location_compound_id[0],
-                                                       self.location_compound_id[1]),
+        salary_url = extractors.photos.sub('Salary', extractors.office_photos.sub('Salaries-', photos_link))
+        location = "%s,%s" % (self.location_compound_id[0], self.location_compound_id[1])
+        if self.salary_index is not None:
+            searched, salary = self.salary_index.lookup(salary_url, location, job_title)
+            if searched:
+                return salary
+        params = {"selectedLocationString": location,
                   "filter.jobTitleFTS": job_title,
                   "sort.ascending": "false",
                   "sort.sortType": "MC"}
-        response = self.get(salary_url, params=params)
-        parser = html.fromstring(response.text)
-        salaries = parser.xpath('//div[contains(@class, "salaryList")]//div[contains(@class, "SalaryRowStyle__row")]')
-        sals = []
-        for salary_parser in salaries:
+        response = self.get(salary_url, kind="salary", params=params)
+        rows = self.parse_salary_rows(response.tree)
+        if self.salary_index is not None:
+            self.salary_index.record(salary_url, location, job_title, rows)
+        for salary_job_title, sample_size, salary_range in rows:
+            if salary_job_title == job_title:
+                return salary_range, sample_size
+        return None
+
+    @classmethod
+    def parse_salary_rows(cls, parser):
+        # returns (job title, sample size, salary range) for each row of a salary page
+        rows = []
+        for salary_parser in extractors.salary_rows(parser):
             try:
-                salary_job_title = salary_parser.xpath('.//div[contains(@class,"JobInfoStyle__jobTitle")]/a/text()')[0]
+                salary_job_title = extractors.salary_title(salary_parser)[0]
             except IndexError:
-                salary_job_title = salary_parser.xpath('.//div[contains(@class,"JobInfoStyle__jobTitle")]/span/text()')[0]
-            # TODO use this to estimate confidence
-            sample_size = int(salary_parser.xpath('.//div[contains(@class,"JobInfoStyle__jobCount")]/text()')[0])
-            salary_range = tuple(map(self.parse_salary_definition,
-                                     salary_parser.xpath('.//div[contains(@class,"RangeBarStyle__values")]/span/text()')))
+                salary_job_title = extractors.salary_title_unlinked(salary_parser)[0]
+            sample_size = int(extractors.salary_count(salary_parser)[0])
+            salary_range = tuple(exchange_rates.to_usd(list(map(cls.parse_salary_amount,
+                                                                extractors.salary_values(salary_parser)))))
             if not salary_range:
                 # this happens because glassdoor only displays the top three matching salaries for un-signed-in users
                 continue
-            sals.append((salary_job_title, sample_size, salary_range))
-            if salary_job_title == job_title:
-                return salary_range
-        return None
+            rows.append((salary_job_title, sample_size, salary_range))
+        return rows
 
     @classmethod
     def fail_dumping_response(cls, reason, response):
@@ -522,45 +2719,23 @@ class SingleSearch(BaseSearch):
 
     @staticmethod
     def parse_listing_id(url):
-        return regex.search(r'jobListingId=([^&]+)', url).groups()[0]
-
-    @staticmethod
-    def parse_promised_jobs(parser):
-        # parse the total amount of jobs glassdoor claims our search to contain
-        # for some reason this amount is given in two different formats sometimes
-        try:
-            j1 = parser.xpath('//*[@class="jobsCount"]/text()')
-            j2 = regex.search(r'([0-9,]+)', j1[0]).groups()[0]
-            j3 = regex.sub(r',', '', j2)
-            return int(j3)
-        except IndexError:
-            try:
-                j1 = parser.xpath('//h1[@id="jobTitle"]/text()')[0]
-                return int(regex.search("We found ([0-9]+)", j1).groups()[0])
-            except IndexError:
-                return None
+        return extractors.listing_id.search(url).groups()[0]
 
     @staticmethod
     def parse_gd_token(parser):
-        return regex.search(r'gdToken":"([^"]+)"', parser.text_content()).groups()[0]
-
-    get_rate = lru_cache()(converter.get_rate)
+        return extractors.gd_token.search(parser.text_content()).groups()[0]
 
     @classmethod
     def parse_salary_definition(cls, salary):
-        per_interval = regex.search(r'per (hour)', salary)
-        per_multipliers = {"hour": 8*(365.25*5/7)}
-        per_multiplier = per_multipliers[per_interval.groups()[0]] if per_interval else 1
-        currencies = ["$", "CHF"]
-        multipliers = {"m": 1000000, "k": 1000, "": 1}
-        currencies_regex = "(%s)" % "|".join(map(regex.escape, currencies))
-        multipliers_regex = "(%s)" % "|".join(map(regex.escape, multipliers.keys()))
-        currency, amount, multiplier = regex.findall(r'%s([0-9]+)%s' % (currencies_regex, multipliers_regex),
-                                                     salary,
-                                                     flags=regex.IGNORECASE)[0]
-        currency_multiplier = cls.get_rate(currency, 'USD') if currency != '$' else 1
-        result = int(amount) * multipliers[multiplier.lower()] * per_multiplier * currency_multiplier
-        return result
+        return exchange_rates.to_usd([cls.parse_salary_amount(salary)])[0]
+
+    @staticmethod
+    def parse_salary_amount(salary):
+        # the yearly amount of a salary, in its own currency; returns (amount, currency)
+        per_interval = extractors.per_hour.search(salary)
+        per_multiplier = extractors.per_multipliers[per_interval.groups()[0]] if per_interval else 1
+        currency, amount, multiplier = extractors.salary_definition.findall(salary)[0]
+        return int(amount) * extractors.multipliers[multiplier.lower()] * per_multiplier, currency
 
     @classmethod
     def parse_industry_options(cls, parser):
@@ -572,7 +2747,286 @@ class SingleSearch(BaseSearch):
 
     @staticmethod
     def parse_filter_options(parser, option):
-        t = list(filter(lambda s: '"filterOptions":"' in s.text_content(), parser.xpath("//script")))[0].text_content()
-        return ast.literal_eval(regex.sub(r'\\(.)',
-                                          lambda x: x.groups()[0],
-                                          regex.search(r'%s.*?\\"options\\":({.*?})' % option, t).groups()[0]))
+        import ast
+        t = list(filter(lambda s: '"filterOptions":"' in s.text_content(), extractors.scripts(parser)))[0].text_content()
+        return ast.literal_eval(extractors.filter_options_escape.sub(
+            lambda x: x.groups()[0],
+            extractors.filter_options[option].search(t).groups()[0]))
+
+
+class Coordinator:
+    """
+    Runs a sweep on one worker process per identity, through a WorkQueue at queue_path: one work unit per location
+    and keyword, and a search that's too big gets split into one unit per partition, which any worker can pick up.
+    An identity is a dict of the headers, proxies and base_url of its HTTPTransport, and the average_rate and
+    minimum_delay of its Throttler (or, under "rate_controller", the arguments of a RateController to use instead);
+    each has its own throttle, so throughput grows with the amount of identities.
+    Running a coordinator again on the same queue continues the sweep where it stopped.
+    """
+    def __init__(self, keywords, locations, identities, queue_path, lease_time=10 * 60, max_attempts=3, **options):
+        self.keywords = [keywords] if isinstance(keywords, str) else keywords
+        self.locations = [locations] if isinstance(locations, str) else locations
+        self.identities = identities
+        self.queue_path = queue_path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        # the rest of Search's filters and settings, e.g. minimum_salary or workers; they have to be picklable
+        self.options = options
+
+    def plan(self, queue):
+        for location in self.locations:
+            for keyword in self.keywords:
+                queue.put(location, keyword, self.options.get("industry_code", -1),
+                          self.options.get("minimum_employer_size", ES_ANY))
+
+    def run(self):
+        # returns every listing the workers scraped, deduplicated by listing_id
+        import multiprocessing
+        queue = WorkQueue(self.queue_path, self.lease_time, self.max_attempts)
+        try:
+            self.plan(queue)
+            processes = [multiprocessing.Process(target=work, args=(self.queue_path, identity, self.options,
+                                                                    self.lease_time, self.max_attempts))
+                         for identity in self.identities]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            counts = queue.counts()
+            if counts.get("failed"):
+                print("Gave up on %d of %d work units" % (counts["failed"], sum(counts.values())))
+            if queue.unfinished():
+                print("%d work units left unfinished" % queue.unfinished())
+            return queue.listings()
+        finally:
+            queue.close()
+
+
+def work(queue_path, identity=None, options=None, lease_time=10 * 60, max_attempts=3, poll_interval=1):
+    # the main loop of a Coordinator's worker process: leases and scrapes work units until there are none left
+    identity = identity or {}
+    queue = WorkQueue(queue_path, lease_time, max_attempts)
+    import socket
+    from concurrent.futures import ThreadPoolExecutor
+    name = "%s-%s" % (socket.gethostname(), os.getpid())
+    transport = HTTPTransport(headers=identity.get("headers"), proxies=identity.get("proxies"),
+                              base_url=identity.get("base_url"))
+    if "rate_controller" in identity:
+        throttler_ = RateController(**identity["rate_controller"])
+    else:
+        throttler_ = Throttler(identity.get("average_rate", 3), identity.get("minimum_delay", 0.673))
+    search = Search([], [], throttler_=throttler_, progress_tracker=ProgressTracker(autoprint=False),
+                    transport=transport, **(options or {}))
+    if search.workers > 1:
+        search.executor = ThreadPoolExecutor(max_workers=search.workers)
+    if search.paranoid:
+        search.get_home_page()
+    try:
+        while True:
+            unit = queue.lease(name)
+            if unit is None:
+                if not queue.unfinished():
+                    return
+                sleep(poll_interval)  # another worker's unit may still come back to the queue
+                continue
+            unit_id, location, keyword, industry_code, employer_size = unit
+            single_search = search.single_search(keyword, location, industry_code, employer_size)
+            single_search.work_queue = queue
+            # per unit; the listings a unit that failed halfway did store are in the queue, and are skipped when it's
+            # retried, but the ones it didn't get to storing are scraped again
+            single_search.listing_registry = WorkQueueRegistry(queue)
+            try:
+                for listing in single_search.iter_listings():
+                    queue.store(unit_id, name, listing)
+            except TerminalScrapeError as e:
+                # most likely this identity got flagged as a bot; leave its unit to the other workers
+                queue.fail(unit_id, str(e))
+                print("Worker %s stopping: %s" % (name, e))
+                return
+            except Exception as e:
+                queue.fail(unit_id, repr(e))
+                print("Worker %s failed %s/%s/%s/%s: %r" % (name, location, keyword, industry_code, employer_size, e))
+            else:
+                queue.complete(unit_id)
+    finally:
+        if search.executor:
+            search.executor.shutdown()
+        queue.close()
+
+
+class Batch:
+    """
+    A batch of sweeps, run in one process by python -m glassdoor, from a job file (json, or yaml with PyYAML
+    installed) like:
+        {"concurrency": 2, "throttle": {"average_rate": 3}, "defaults": {"minimum_salary": 60000},
+         "stores": {"cache": true, "salary_index": "salaries.sqlite"},
+         "sweeps": [{"name": "python-boston", "keywords": ["python"], "locations": ["Boston, MA"], "priority": 1,
+                     "minimum_rating": 3.5, "employer_size": "ES_201_500", "output": "python-boston.parquet"}]}
+    Sweeps run highest priority first, up to concurrency of them at once. They all share one throttle (a Throttler,
+    or a RateController if the job file has a "rate_controller"), one connection pool, one set of metrics and one of
+    each store (but each has a transport, and so headers such as its Referer, of its own), so they draw from the same
+    rate limit, and a location or salary page looked up by one sweep isn't looked up again by the next. A store
+    that's true is kept at its default path; one that's a string, at that path.
+    Each sweep is exported to its output (jsonl, sqlite, parquet or arrow, by extension; name.jsonl by default), and,
+    given a resume path, checkpointed there.
+    """
+    sweep_keys = ["name", "keywords", "locations", "minimum_salary", "minimum_rating", "industry_code", "employer_size",
+                  "paranoid", "workers", "priority", "output", "resume"]
+    job_keys = ["concurrency", "throttle", "rate_controller", "stores", "defaults", "sweeps"]
+    store_types = {"cache": ResponseCache, "listing_index": ListingIndex, "partition_counts": PartitionCounts,
+                   "salary_index": SalaryIndex, "location_index": LocationIndex, "description_store": DescriptionStore}
+    sinks = {".jsonl": JSONLSink, ".sqlite": SQLiteSink, ".db": SQLiteSink, ".parquet": ParquetSink,
+             ".arrow": ArrowSink}
+    employer_sizes = {"ES_ANY": ES_ANY, "ES_0_200": ES_0_200, "ES_201_500": ES_201_500, "ES_501_1000": ES_501_1000,
+                      "ES_1001_5000": ES_1001_5000, "ES_5001_PLUS": ES_5001_PLUS}
+
+    def __init__(self, sweeps, concurrency=1, throttle=None, rate_controller=None, stores=None, defaults=None):
+        self.concurrency = concurrency
+        self.throttle = throttle or {}  # Throttler arguments
+        self.rate_controller = rate_controller  # RateController arguments (true for RateController.for_host())
+        self.stores = stores or {}
+        unknown = set(self.stores) - set(self.store_types)
+        if unknown:
+            raise ValueError("Unknown store(s) %s; expected some of %s" % (", ".join(sorted(unknown)),
+                                                                          ", ".join(self.store_types)))
+        self.sweeps = [self.sweep(dict(defaults or {}, **sweep), i) for i, sweep in enumerate(sweeps)]
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            if os.path.splitext(path)[1] in (".yaml", ".yml"):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("Reading yaml job files needs PyYAML installed")
+                job = yaml.safe_load(f)
+            else:
+                job = json.load(f)
+        if not isinstance(job, dict) or not isinstance(job.get("sweeps"), list):
+            raise ValueError("%s: a job file needs a list of sweeps" % path)
+        unknown = set(job) - set(cls.job_keys)
+        if unknown:
+            raise ValueError("%s: unknown key(s) %s" % (path, ", ".join(sorted(unknown))))
+        return cls(**job)
+
+    def sweep(self, sweep, i):
+        # validates a sweep (with the defaults applied), and fills in its name, priority and output
+        name = sweep.setdefault("name", "sweep-%d" % (i + 1))
+        unknown = set(sweep) - set(self.sweep_keys)
+        if unknown:
+            raise ValueError("Sweep %s: unknown key(s) %s" % (name, ", ".join(sorted(unknown))))
+        for key in ["keywords", "locations"]:
+            if isinstance(sweep.get(key), str):
+                sweep[key] = [sweep[key]]
+            if not sweep.get(key):
+                raise ValueError("Sweep %s: needs %s" % (name, key))
+        size = sweep.get("employer_size", ES_ANY)
+        if isinstance(size, str):
+            if size not in self.employer_sizes:
+                raise ValueError("Sweep %s: unknown employer_size %s" % (name, size))
+            size = self.employer_sizes[size]
+        sweep["employer_size"] = size
+        sweep.setdefault("priority", 0)
+        sweep.setdefault("output", name + ".jsonl")
+        if os.path.splitext(sweep["output"])[1] not in self.sinks:
+            raise ValueError("Sweep %s: output must end in one of %s" % (name, ", ".join(self.sinks)))
+        return sweep
+
+    def plan(self):
+        # the sweeps in the order they get started in: by priority, then in job file order
+        return sorted(self.sweeps, key=lambda sweep: -sweep["priority"])
+
+    def describe(self):
+        # the plan, for --dry-run; builds nothing and sends no requests
+        if self.rate_controller:
+            throttle = "an adaptive rate controller"
+        else:
+            throttle = "one throttle (%ss average)" % self.throttle.get("average_rate", 3)
+        lines = ["%d sweeps, %d at a time, sharing %s" % (len(self.sweeps), self.concurrency, throttle)]
+        for store, path in sorted(self.stores.items()):
+            lines.append("  %s: %s" % (store, path if isinstance(path, str) else "default path"))
+        for i, sweep in enumerate(self.plan()):
+            sizes = {size: name for name, size in self.employer_sizes.items()}
+            filters = ", ".join("%s=%s" % (key, sizes[sweep[key]] if key == "employer_size" else sweep[key]) for key in
+                                ["minimum_salary", "minimum_rating", "industry_code", "employer_size", "paranoid",
+                                 "workers"] if sweep.get(key) not in (None, False, ES_ANY))
+            lines.append("%d. %s (priority %s): %d keywords x %d locations%s -> %s%s" % (
+                i + 1, sweep["name"], sweep["priority"], len(sweep["keywords"]), len(sweep["locations"]),
+                ", " + filters if filters else "", sweep["output"],
+                ", resuming from %s" % sweep["resume"] if sweep.get("resume") else ""))
+        return "\n".join(lines)
+
+    def run(self, new_transport=None):
+        # runs every sweep; returns {name: listings written, or the exception that stopped it}
+        # new_transport makes each sweep's transport; by default, HTTPTransports that share one connection pool
+        from concurrent.futures import ThreadPoolExecutor
+        if self.rate_controller:
+            options = self.rate_controller if isinstance(self.rate_controller, dict) else {}
+            shared_throttler = RateController.for_host(**options) if self.rate_controller is True else \
+                RateController(**options)
+        else:
+            shared_throttler = Throttler(**self.throttle)
+        if new_transport is None:
+            pool = HTTPTransport().adapter
+
+            def new_transport():
+                return HTTPTransport(adapter=pool)
+        self.new_transport = new_transport
+        shared = {"throttler_": shared_throttler, "metrics": Metrics()}
+        for store, path in self.stores.items():
+            shared[store] = self.store_types[store](path if isinstance(path, str) else None)
+        shared.setdefault("location_index", LocationIndex(":memory:"))
+        self.metrics = shared["metrics"]
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [(sweep["name"], executor.submit(self.run_sweep, sweep, shared)) for sweep in self.plan()]
+            for name, future in futures:
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print("Sweep %s failed: %r" % (name, e))
+                    results[name] = e
+        return results
+
+    def run_sweep(self, sweep, shared):
+        start = time.time()
+        print("Starting sweep %s" % sweep["name"])
+        # with several sweeps at once, their progress lines would only get in each other's way
+        progress = ProgressTracker(autoprint=self.concurrency == 1)
+        search = Search(sweep["keywords"], sweep["locations"], sweep.get("minimum_salary"), sweep.get("minimum_rating"),
+                        sweep.get("industry_code", -1), sweep["employer_size"], sweep.get("paranoid", False),
+                        progress_tracker=progress, workers=sweep.get("workers", 1), transport=self.new_transport(),
+                        **shared)
+        sink = self.sinks[os.path.splitext(sweep["output"])[1]](sweep["output"])
+        written = search.export(sink, sweep.get("resume"))
+        print("Finished sweep %s: %d listings in %.0fs, written to %s" % (sweep["name"], written, time.time() - start,
+                                                                          sweep["output"]))
+        return written
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m glassdoor", description="Runs the sweeps of a job file.")
+    parser.add_argument("job_file", help="a json (or yaml) job file; see glassdoor.Batch for its format")
+    parser.add_argument("--dry-run", action="store_true", help="print the plan, without scraping anything")
+    parser.add_argument("--concurrency", type=int, help="how many sweeps to run at once (overrides the job file's)")
+    parser.add_argument("--metrics", metavar="PATH", help="write the batch's metrics to this json file at the end")
+    args = parser.parse_args(argv)
+    try:
+        batch = Batch.load(args.job_file)
+    except (OSError, ImportError, ValueError, TypeError) as e:
+        parser.error(str(e))
+    if args.concurrency:
+        batch.concurrency = args.concurrency
+    print(batch.describe())
+    if args.dry_run:
+        return 0
+    results = batch.run()
+    print(batch.metrics.report())
+    if args.metrics:
+        batch.metrics.dump(args.metrics)
+    return 1 if any(isinstance(result, Exception) for result in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# a stand-in for glassdoor, served over http on localhost, that HTTPTransport(base_url=...) and Coordinator identities
+# can be pointed at; just enough of the site for a sweep to run end to end
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, parse_qsl, urlsplit
+
+import pytest
+
+import glassdoor
+
+FILTERS = ('<script>var a = {"filterOptions":"{\\"INDUSTRY\\":{\\"options\\":{\\"-1\\":\\"All\\",'
+           '\\"100\\":\\"Tech\\",\\"200\\":\\"Finance\\"}},\\"SALRANGE\\":{\\"options\\":{\\"40000\\":\\"40k\\",'
+           '\\"80000\\":\\"80k\\"}}}"};</script>')
+BOT_PAGE = '<html>"isPotentialBot":true</html>'
+NO_MATCHES_PAGE = ("<html>Your filtered search does not match any jobs. Try to broaden your search by changing the "
+                   "filters above.</html>")
+
+
+class Site:
+    """
+    Every keyword and location finds the same n_jobs listings (listing ids 0 to n_jobs - 1), per_page of them per
+    search page. Looking up a location in unknown_locations finds nothing (which fails the search). After budget
+    requests (if set), and always for a user agent in bots, every page is a bot check.
+    partitions overrides the amount of jobs of a search filtered by an industry ("100" or "200"), or by an industry
+    and employer size ("100/1"); listing ids are then distinct per partition (industry * 1000 + employer size * 100
+    on). searches records the (industry, employer size) of every search posted. on_request, if set, is called with the
+    method and url of every request before it's answered.
+    """
+    def __init__(self, n_jobs=7, per_page=3):
+        self.n_jobs = n_jobs
+        self.per_page = per_page
+        self.unknown_locations = set()
+        self.bots = set()
+        self.partitions = {}
+        self.searches = []
+        self.on_request = None
+        self.budget = None
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def respond(self, method, url, data, user_agent):
+        if self.on_request:
+            self.on_request(method, url)
+        with self.lock:
+            self.requests.append((method, url))
+            if self.budget is not None:
+                if self.budget <= 0:
+                    return BOT_PAGE
+                self.budget -= 1
+        if user_agent in self.bots:
+            return BOT_PAGE
+        path, query = urlsplit(url).path, parse_qs(urlsplit(url).query)
+        if "findPopularLocationAjax" in path:
+            if data.get("term") in self.unknown_locations:
+                return "[]"
+            return json.dumps([{"locationType": "C", "locationId": "1154532"}])
+        if path == "/":
+            return "<html>home</html>"
+        if "details.htm" in path:
+            return ('<html><div class="jobDescriptionContent"><p>Description of %s</p></div></html>'
+                    % query["jobListingId"][0])
+        if "jobs.htm" in path:
+            if method == "POST":
+                partition = (data.get("industryId", "-1"), data.get("employerSizes", "0"))
+                with self.lock:
+                    self.searches.append(partition)
+                return self.search_page(1, *partition)
+            return self.search_page(int(query["p"][0]), *query["partition"][0].split("_"))
+        raise ValueError("not a page of the stand-in site: %s" % url)
+
+    def jobs(self, industry, employer_size):
+        key = industry if employer_size == "0" else "%s/%s" % (industry, employer_size)
+        first = (int(industry) * 1000 if industry != "-1" else 0) + int(employer_size) * 100
+        return list(range(first, first + self.partitions.get(key, self.n_jobs)))
+
+    def search_page(self, page, industry="-1", employer_size="0"):
+        jobs = self.jobs(industry, employer_size)
+        if not jobs:
+            return NO_MATCHES_PAGE
+        ids = jobs[(page - 1) * self.per_page:page * self.per_page]
+        if not ids:
+            return "<html>Sorry, we can't find that page</html>"
+        items = "".join(
+            '<li class="jl"><a href="/partner/jobListing.htm?pos=1&jobListingId=%d">Engineer %d</a>'
+            '<div class="flexbox empLoc"><div>Acme %d – </div></div><span class="subtle loc">Boston, MA</span>'
+            '<span class="green small">$%dk-$%dk</span><span class="compactStars ">4.%d</span></li>'
+            % (i, i, i, 50 + i, 70 + i, i) for i in ids)
+        next_page = ('<li class="next"><a href="/Job/jobs.htm?p=%d&partition=%s_%s">next</a></li>'
+                     % (page + 1, industry, employer_size))
+        return ("<html><body><div class='jobsCount'>%d Jobs</div><ul>%s</ul><ul>%s</ul>%s</body></html>"
+                % (len(jobs), items, next_page, FILTERS))
+
+    def requested(self, fragment):
+        return sum(1 for _, url in self.requests if fragment in url)
+
+
+@pytest.fixture
+def site():
+    site = Site()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, method):
+            data = {}
+            if method == "POST":
+                data = dict(parse_qsl(self.rfile.read(int(self.headers.get("content-length", 0))).decode()))
+            body = site.respond(method, self.path, data, self.headers.get("user-agent")).encode()
+            self.send_response(200)
+            self.send_header("content-type", "text/html; charset=utf-8")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self.reply("GET")
+
+        def do_POST(self):
+            self.reply("POST")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    site.base_url = "http://127.0.0.1:%d" % server.server_address[1]
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def offline(tmp_path, monkeypatch):
+    # keep default_data_path() and the exchange rates away from the real cache directory and the network
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setattr(glassdoor, "exchange_rates", glassdoor.ExchangeRates(rates={}))
+
+
+@pytest.fixture
+def new_search(site):
+    # a Search of the stand-in site, with next to no throttling
+    def new_search(keywords=("python",), locations=("Boston, MA",), **options):
+        options.setdefault("throttler_", glassdoor.Throttler(0.002, 0.001))
+        options.setdefault("transport", glassdoor.HTTPTransport(base_url=site.base_url))
+        return glassdoor.Search(list(keywords), list(locations),
+                                progress_tracker=glassdoor.ProgressTracker(autoprint=False), **options)
+    return new_search
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import glassdoor
+
+
+def details_requested(site, start=0):
+    return sorted(int(url.rsplit("=", 1)[1]) for _, url in site.requests[start:] if "details.htm" in url)
+
+
+def test_resume_after_crash_mid_page(site, new_search, tmp_path):
+    path = str(tmp_path / "sweep.json")
+    # dies on listing 4's details page, halfway through the second search page
+    site.budget = 7
+    with pytest.raises(glassdoor.TerminalScrapeError):
+        new_search().run(resume=path)
+    with open(path) as f:
+        assert json.load(f)["cursor"]["page_url"].endswith("p=2&partition=-1_0")
+    with open(path + ".listings") as f:
+        assert [json.loads(line)["listing_id"] for line in f] == ["0", "1", "2", "3"]
+
+    site.budget = None
+    start = len(site.requests)
+    listings = new_search().run(resume=path)
+    assert sorted(listing["listing_id"] for listing in listings) == [str(i) for i in range(7)]
+    # the second page is fetched again, but only the listings that weren't emitted yet are scraped
+    assert site.requested("/Job/jobs.htm?p=1") == 0
+    assert details_requested(site, start) == [4, 5, 6]
+
+
+def test_resume_before_first_cursor(site, new_search, tmp_path):
+    path = str(tmp_path / "sweep.json")
+    site.budget = 4
+    with pytest.raises(glassdoor.TerminalScrapeError):
+        new_search().run(resume=path)
+    site.budget = None
+    start = len(site.requests)
+    assert len(new_search().run(resume=path)) == 7
+    assert details_requested(site, start) == [2, 3, 4, 5, 6]
+
+
+def test_torn_last_line_is_dropped(site, new_search, tmp_path):
+    path = str(tmp_path / "sweep.json")
+    site.budget = 4
+    with pytest.raises(glassdoor.TerminalScrapeError):
+        new_search().run(resume=path)
+    with open(path + ".listings", "a") as f:
+        f.write('{"listing_id": "2", "tit')
+    checkpoint = glassdoor.Checkpoint(path)
+    checkpoint.close()
+    assert [listing["listing_id"] for listing in checkpoint.listings] == ["0", "1"]
+    site.budget = None
+    assert sorted(listing["listing_id"] for listing in new_search().run(resume=path)) == [str(i) for i in range(7)]
+
+
+def test_resuming_a_finished_sweep_fetches_nothing(site, new_search, tmp_path):
+    path = str(tmp_path / "sweep.json")
+    listings = new_search(["python", "java"]).run(resume=path)
+    start = len(site.requests)
+    assert new_search(["python", "java"]).run(resume=path) == listings
+    assert len(site.requests) == start
+    # both keywords found every listing, and the attributions were checkpointed along with them
+    assert all(listing["keywords"] == ["python", "java"] for listing in listings)
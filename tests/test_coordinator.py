@@ -0,0 +1,88 @@
+# runs Coordinator's worker processes against the stand-in site (see conftest.py), through each identity's base_url
+import time
+
+import pytest
+
+import glassdoor
+
+
+@pytest.fixture
+def identities(site):
+    def identities(*user_agents):
+        return [{"base_url": site.base_url, "headers": {"user-agent": user_agent}, "average_rate": 0.002,
+                 "minimum_delay": 0.001} for user_agent in user_agents]
+    return identities
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "queue.sqlite")
+
+
+def units(queue_path):
+    queue = glassdoor.WorkQueue(queue_path)
+    try:
+        return queue.db.execute("SELECT location, status, worker, attempts, error FROM units ORDER BY id").fetchall()
+    finally:
+        queue.close()
+
+
+def test_listings_are_deduplicated_by_listing_id(identities, queue_path):
+    # every keyword and location finds the same 7 listings
+    listings = glassdoor.Coordinator(["python", "java"], ["Boston, MA", "Cambridge, MA"], identities("a", "b"),
+                                     queue_path).run()
+    assert sorted(int(listing["listing_id"]) for listing in listings) == list(range(7))
+    assert [status for _, status, _, _, _ in units(queue_path)] == ["done"] * 4
+
+
+def test_details_are_scraped_once_per_queue(site, identities, queue_path):
+    listings = glassdoor.Coordinator(["python", "java"], ["Boston, MA", "Cambridge, MA"], identities("a"),
+                                     queue_path).run()
+    assert site.requested("details.htm") == 7
+    # each listing is stored once, but attributed to every unit that found it
+    assert all(sorted(listing["keywords"]) == ["java", "python"]
+               and sorted(listing["requested_locations"]) == ["Boston, MA", "Cambridge, MA"] for listing in listings)
+
+
+def test_expired_lease_goes_back_to_the_queue(identities, queue_path):
+    # a worker that leased the only unit, and then died
+    queue = glassdoor.WorkQueue(queue_path, lease_time=1)
+    queue.put("Boston, MA", "python")
+    assert queue.lease("dead")[2] == "python"
+    assert queue.lease("alive") is None
+    queue.close()
+    start = time.time()
+    listings = glassdoor.Coordinator("python", "Boston, MA", identities("a"), queue_path, lease_time=1).run()
+    assert len(listings) == 7
+    [(_, status, worker, attempts, _)] = units(queue_path)
+    assert (status, attempts) == ("done", 2) and worker != "dead"
+    assert time.time() - start >= 0.5  # it had to wait for the lease to run out
+
+
+def test_unit_is_given_up_on_after_max_attempts(site, identities, queue_path):
+    site.unknown_locations.add("Nowhere")
+    listings = glassdoor.Coordinator("python", ["Boston, MA", "Nowhere"], identities("a"), queue_path,
+                                     max_attempts=2).run()
+    assert len(listings) == 7
+    (_, boston_status, _, _, _), (_, nowhere_status, _, nowhere_attempts, nowhere_error) = units(queue_path)
+    assert (boston_status, nowhere_status, nowhere_attempts) == ("done", "failed", 2)
+    assert "IndexError" in nowhere_error
+
+
+def test_worker_flagged_as_a_bot_leaves_its_unit_to_the_others(site, identities, queue_path):
+    site.bots.add("bot")
+    listings = glassdoor.Coordinator(["python", "java"], "Boston, MA", identities("bot", "a"), queue_path).run()
+    assert len(listings) == 7
+    assert [status for _, status, _, _, _ in units(queue_path)] == ["done"] * 2
+
+
+def test_running_again_continues_on_the_existing_queue(site, identities, queue_path):
+    coordinator = glassdoor.Coordinator(["python"], "Boston, MA", identities("a"), queue_path)
+    listings = coordinator.run()
+    start = len(site.requests)
+    assert coordinator.run() == listings
+    assert len(site.requests) == start  # every unit was done already
+    # a new keyword is only a new unit; the listings it finds again aren't stored twice
+    listings = glassdoor.Coordinator(["python", "java"], "Boston, MA", identities("a"), queue_path).run()
+    assert len(listings) == 7
+    assert site.searches == [("-1", "0")] * 2
@@ -0,0 +1,51 @@
+import json
+import time
+
+import pytest
+
+import glassdoor
+
+
+@pytest.fixture
+def rates(tmp_path):
+    path = str(tmp_path / "exchange-rates.json")
+
+    def rates(fetched, chf, ttl=60, new_chf=None):
+        with open(path, "w") as f:
+            json.dump({"fetched": fetched, "rates": {"CHF": chf}}, f)
+        rates = glassdoor.ExchangeRates(path, ttl=ttl)
+        rates.refreshes = 0
+
+        def refresh():
+            rates.refreshes += 1
+            if new_chf is None:
+                raise IOError("offline")
+            return {"fetched": time.time(), "rates": {"CHF": new_chf}}
+        rates.refresh = refresh
+        return rates
+    return rates
+
+
+def test_rates_go_stale_mid_sweep(rates):
+    exchange_rates = rates(time.time(), 1.0, ttl=0.2, new_chf=2.0)
+    assert exchange_rates.read_snapshot()
+    assert exchange_rates.to_usd([(10, "CHF")]) == [10.0]
+    time.sleep(0.3)
+    assert not exchange_rates.read_snapshot()
+    assert exchange_rates.to_usd([(10, "CHF"), (10, "$")]) == [20.0, 10]
+    assert exchange_rates.refreshes == 1
+
+
+def test_usd_salaries_never_fetch_rates(rates):
+    exchange_rates = rates(time.time() - 3600, 1.0)
+    assert not exchange_rates.read_snapshot()
+    assert exchange_rates.to_usd([(10, "$"), (20, "USD")]) == [10, 20]
+    assert exchange_rates.refreshes == 0
+
+
+def test_failed_refresh_uses_the_stale_snapshot_and_waits_to_retry(rates, capsys):
+    exchange_rates = rates(time.time() - 3600, 1.5)
+    assert exchange_rates.to_usd([(10, "CHF")]) == [15.0]
+    assert exchange_rates.to_usd([(10, "CHF")]) == [15.0]
+    assert exchange_rates.refreshes == 1
+    assert "Couldn't refresh exchange rates" in capsys.readouterr().out
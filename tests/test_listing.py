@@ -0,0 +1,30 @@
+import pickle
+
+import pytest
+
+import glassdoor
+
+
+def test_to_dict_round_trips_none_and_missing_fields():
+    listing = {"title": "Engineer", "company": None, "location": "Remote", "city": "Remote", "state": None,
+               "listing_id": "1", "rating": 4.2, "salary": (60000, 90000), "description": "..."}
+    compact = glassdoor.Listing.from_dict(listing)
+    assert compact.to_dict() == listing
+    assert list(compact.to_dict()) == list(listing)
+    assert compact["state"] is None and "state" in compact and compact.get("state", "?") is None
+    assert "salary_sample_size" not in compact and compact.get("salary_sample_size", "?") == "?"
+    with pytest.raises(KeyError):
+        compact["salary_sample_size"]
+    assert compact.state is None and compact.salary_sample_size is None
+    assert pickle.loads(pickle.dumps(compact)) == listing
+
+
+def test_salary_none_and_missing():
+    assert glassdoor.Listing.from_dict({"listing_id": "1", "salary": None}).to_dict() == \
+        {"listing_id": "1", "salary": None}
+    without = glassdoor.Listing.from_dict({"listing_id": "1"})
+    assert "salary" not in without and without.to_dict() == {"listing_id": "1"}
+
+
+def test_compact_run_matches_the_dicts(new_search):
+    assert new_search().run(compact=True).to_dicts() == new_search().run()
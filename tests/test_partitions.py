@@ -0,0 +1,60 @@
+# the partition planner, against a stand-in site whose searches are over a lowered partition_cap
+import pytest
+
+import glassdoor
+
+ALL, TECH, FINANCE = ("-1", "0"), ("100", "0"), ("200", "0")
+TECH_BY_SIZE = [("100", str(size)) for size in glassdoor.SingleSearch.employer_sizes]
+
+
+@pytest.fixture(autouse=True)
+def partitioned(site, monkeypatch):
+    monkeypatch.setattr(glassdoor.SingleSearch, "partition_cap", 10)
+    # too big; split by industry into tech (still too big; split by employer size) and finance
+    site.partitions.update({"-1": 20, "100": 12, "200": 5, "100/1": 4, "100/2": 0, "100/3": 3, "100/4": 0,
+                            "100/5": 2})
+    return site
+
+
+def ids(listings):
+    return sorted(int(listing["listing_id"]) for listing in listings)
+
+
+EXPECTED = ([100100 + i for i in range(4)] + [100300 + i for i in range(3)] + [100500 + i for i in range(2)]
+            + [200000 + i for i in range(5)])
+
+
+def test_oversized_search_is_split_recursively(site, new_search):
+    assert ids(new_search().run()) == EXPECTED
+    assert site.searches == [ALL, TECH] + TECH_BY_SIZE + [FINANCE]
+
+
+def test_known_split_is_reused(site, new_search, tmp_path):
+    path = str(tmp_path / "partitions.sqlite")
+    new_search(partition_counts=glassdoor.PartitionCounts(path)).run()
+    del site.searches[:]
+    assert ids(new_search(partition_counts=glassdoor.PartitionCounts(path)).run()) == EXPECTED
+    # the oversized searches aren't queried again, and neither are the empty ones
+    assert site.searches == [("100", "1"), ("100", "3"), ("100", "5"), FINANCE]
+
+
+def test_resume_into_a_sub_partition(site, new_search, tmp_path):
+    path = str(tmp_path / "sweep.json")
+    # dies on the second page of the tech partition of employers with up to 200 employees
+    site.budget = 8
+    with pytest.raises(glassdoor.TerminalScrapeError):
+        new_search().run(resume=path)
+    checkpoint = glassdoor.Checkpoint(path)
+    checkpoint.close()
+    assert (checkpoint.cursor["industry_code"], checkpoint.cursor["employer_size"]) == ("100", "1")
+    assert checkpoint.cursor["page_url"].endswith("p=2&partition=100_1")
+    site.budget = None
+    del site.searches[:]
+    start = len(site.requests)
+    assert ids(new_search().run(resume=path)) == EXPECTED
+    # the oversized searches above it are queried again (for their filter options), but the sub-partition isn't:
+    # it continues at its cursor's page, and the ones before it are skipped
+    assert site.searches == [ALL, TECH] + TECH_BY_SIZE[1:] + [FINANCE]
+    assert site.requested("p=2&partition=100_1") == 2
+    assert sorted(int(url.rsplit("=", 1)[1]) for _, url in site.requests[start:] if "details.htm" in url) \
+        == EXPECTED[3:]
@@ -0,0 +1,41 @@
+import statistics
+
+import pytest
+
+import glassdoor
+
+
+def gaps(controller, rate, n=2000):
+    return [controller._cost(rate) / rate for _ in range(n)]
+
+
+def test_max_rate_leaves_room_for_jitter():
+    controller = glassdoor.RateController(rate=5, max_rate=10, minimum_delay=0.5)
+    assert controller.max_rate == 1 and controller.rate == 1
+    for _ in range(200):
+        controller.success()
+    assert controller.rate == 1
+
+
+def test_default_max_rate_is_throttlers():
+    controller = glassdoor.RateController()
+    for _ in range(200):
+        controller.success()
+    assert controller.rate == 1 / 3
+
+
+def test_gaps_are_jittered_at_every_rate():
+    controller = glassdoor.RateController(max_rate=10, minimum_delay=0.5)
+    for rate in (1 / 60, 1 / 3, controller.max_rate):
+        rate_gaps = gaps(controller, rate)
+        assert min(rate_gaps) >= 0.5
+        assert statistics.stdev(rate_gaps) > 0.2
+        assert abs(statistics.mean(rate_gaps) - 1 / rate) < 0.15 / rate
+
+
+def test_replay_miss_isnt_a_bot_signal(new_search, tmp_path):
+    controller = glassdoor.RateController(rate=10, max_rate=10, minimum_delay=0.001)
+    search = new_search(throttler_=controller, transport=glassdoor.ReplayTransport(str(tmp_path)))
+    with pytest.raises(glassdoor.ReplayMissError):
+        search.run()
+    assert controller.rate == 10 and controller.status()["errors"] == 0
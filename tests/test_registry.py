@@ -0,0 +1,28 @@
+import gc
+
+import glassdoor
+
+
+def test_later_copies_add_to_the_first_copys_attributions():
+    attributions = []
+    registry = glassdoor.ListingRegistry(listener=lambda *attribution: attributions.append(attribution))
+    first = {"listing_id": "1", "description": "..."}
+    assert registry.claim(first, "python", "Boston, MA")
+    assert not registry.claim({"listing_id": "1"}, "java", "Boston, MA")
+    assert not registry.claim({"listing_id": "1"}, "python", "Boston, MA")
+    assert (first["keywords"], first["requested_locations"]) == (["python", "java"], ["Boston, MA"])
+    assert attributions == [("1", "python", "Boston, MA"), ("1", "java", "Boston, MA")]
+    assert "1" in registry and len(registry) == 1
+
+
+def test_registry_doesnt_keep_the_listings():
+    registry = glassdoor.ListingRegistry()
+    listing = {"listing_id": "1", "description": "x" * 10000}
+    registry.claim(listing, "python", "Boston, MA")
+    assert not any(referrer is registry.listings for referrer in gc.get_referrers(listing))
+
+
+def test_streamed_sweep_keeps_attributing(new_search):
+    listings = list(new_search(["python", "java"]).iter_listings())
+    assert len(listings) == 7
+    assert all(listing["keywords"] == ["python", "java"] for listing in listings)
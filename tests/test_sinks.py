@@ -0,0 +1,110 @@
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+
+import pytest
+
+import glassdoor
+
+
+def listing(listing_id, **fields):
+    return dict({"listing_id": listing_id, "title": "Engineer", "company": "Acme", "location": "Boston, MA",
+                 "requested_location": "Boston, MA", "city": "Boston", "state": "MA", "rating": 4.2,
+                 "salary": (60000, 90000), "description": "Description of %s" % listing_id}, **fields)
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_jsonl_sink(tmp_path):
+    path = str(tmp_path / "out.jsonl")
+    with glassdoor.JSONLSink(path, batch_size=2) as sink:
+        for listing_id in "abc":
+            sink.write(listing(listing_id))
+        sink.write_attribution("a", "python", "Boston, MA")
+    rows = read_jsonl(path)
+    assert [row["listing_id"] for row in rows] == ["a", "b", "c"]
+    assert set(rows[0]) == set(glassdoor.Sink.columns)
+    assert (rows[0]["salary_low"], rows[0]["salary_high"]) == (60000, 90000)
+    assert read_jsonl(path + ".descriptions")[2] == {"listing_id": "c", "description": "Description of c"}
+    assert read_jsonl(path + ".attributions") == [
+        {"listing_id": "a", "keyword": "python", "requested_location": "Boston, MA"}]
+
+
+def test_sqlite_sink_upserts(tmp_path):
+    path = str(tmp_path / "out.sqlite")
+    with glassdoor.SQLiteSink(path) as sink:
+        sink.write(listing("a", salary_sample_size=12))
+        sink.write_attribution("a", "python", "Boston, MA")
+    # a rerun that didn't scrape the details of "a" again only has its search page fields
+    rerun = listing("a", title="Senior Engineer", rating=4.5)
+    del rerun["salary"], rerun["description"]
+    with glassdoor.SQLiteSink(path) as sink:
+        sink.write(rerun)
+        sink.write(listing("b"))
+        sink.write_attribution("a", "python", "Boston, MA")
+        sink.write_attribution("a", "java", "Boston, MA")
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT title, rating, salary_low, salary_high, salary_sample_size FROM listings "
+                      "WHERE listing_id = 'a'").fetchall() == [("Senior Engineer", 4.5, 60000, 90000, 12)]
+    assert db.execute("SELECT COUNT(*) FROM listings").fetchone() == (2,)
+    assert db.execute("SELECT description FROM descriptions WHERE listing_id = 'a'").fetchone() == ("Description of a",)
+    assert db.execute("SELECT keyword FROM attributions ORDER BY keyword").fetchall() == [("java",), ("python",)]
+
+
+def read_table(path):
+    import pyarrow.ipc
+    import pyarrow.parquet
+    if path.endswith(".parquet"):
+        return pyarrow.parquet.read_table(path)
+    with pyarrow.ipc.open_stream(path) as reader:
+        return reader.read_all()
+
+
+@pytest.mark.parametrize("sink_class, path", [("ArrowSink", "out.arrow"), ("ParquetSink", "out.parquet")])
+def test_arrow_sinks(tmp_path, sink_class, path):
+    pyarrow = pytest.importorskip("pyarrow")
+    sink_class = getattr(glassdoor, sink_class)
+    path = str(tmp_path / path)
+    with sink_class(path, batch_size=2) as sink:
+        for listing_id in "abc":
+            sink.write(listing(listing_id))
+        sink.write_attribution("a", "python", "Boston, MA")
+    table = read_table(path)
+    assert table.column("listing_id").to_pylist() == ["a", "b", "c"]
+    assert table.column("salary_high").to_pylist() == [90000.0] * 3
+    assert pyarrow.types.is_dictionary(table.schema.field("company").type)
+    assert read_table(sink_class.descriptions_path(path)).column("description").to_pylist()[0] == "Description of a"
+    assert read_table(sink_class.attributions_path(path)).column("keyword").to_pylist() == ["python"]
+
+
+def test_export(new_search, tmp_path):
+    path = str(tmp_path / "out.sqlite")
+    assert new_search(["python", "java"], ["Boston, MA", "Cambridge, MA"]).export(glassdoor.SQLiteSink(path)) == 7
+    db = sqlite3.connect(path)
+    assert db.execute("SELECT COUNT(*) FROM listings").fetchone() == (7,)
+    # one attribution per listing, keyword and requested location
+    assert db.execute("SELECT COUNT(*) FROM attributions").fetchone() == (7 * 2 * 2,)
+
+
+def test_checkpointed_export_survives_a_hard_kill(site, new_search, tmp_path):
+    path, resume = str(tmp_path / "out.sqlite"), str(tmp_path / "sweep.json")
+
+    def export():
+        new_search().export(glassdoor.SQLiteSink(path), resume)
+    process = multiprocessing.Process(target=export)
+    # killed halfway through the second page, with listings 3 and 4 still in the sink's batch
+    site.on_request = lambda method, url: "jobListingId=5" in url and os.kill(process.pid, signal.SIGKILL)
+    process.start()
+    process.join()
+    assert process.exitcode == -signal.SIGKILL
+    site.on_request = None
+    new_search().export(glassdoor.SQLiteSink(path), resume)
+    db = sqlite3.connect(path)
+    assert [listing_id for (listing_id,) in db.execute("SELECT listing_id FROM listings ORDER BY listing_id")] == \
+        [str(i) for i in range(7)]
+    assert db.execute("SELECT COUNT(*) FROM attributions").fetchone() == (7,)